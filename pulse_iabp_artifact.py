@@ -0,0 +1,213 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP NATIVE ARTIFACT
+# Pickle-free, memory-mapped export of the compiled model
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# model_artifact/
+#     header.json          features, thresholds, performance, array manifest
+#     <array>.npy          one file per CompiledSVM array (memory-mapped on load)
+#     <model>.<array>.npy  arrays of the bundle's other models, e.g. base_svm
+#
+# Loading needs only NumPy: no pickle, sklearn or pandas, and the read-only
+# mappings are shared between every process that opens the same files. Every
+# file is replaced atomically, so re-exporting never truncates a file that a
+# running process still has mapped.
+#
+# Usage:
+#   python pulse_iabp_artifact.py export [--bundle model_bundle.pkl] [--out model_artifact]
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from pulse_iabp_compiled import CompiledSVC, CompiledSVM, compile_models
+from pulse_iabp_model import BUNDLE_PATH, check_features, load_bundle
+
+ARTIFACT_PATH = "model_artifact"
+HEADER_FILE = "header.json"
+FORMAT_VERSION = 1
+
+# Bundle sections copied into the header (everything the calculator reads)
+HEADER_SECTIONS = ("model_info", "training_info", "calibration", "performance")
+THRESHOLD_KEYS = ("low", "medium", "high")
+
+PRIMARY_MODEL = "calibrated_svm"
+MODEL_KINDS = {"calibrated": CompiledSVM, "svc": CompiledSVC}
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def model_version(bundle, bundle_path=BUNDLE_PATH):
+    """model_info version plus the source bundle's sha256 prefix, e.g. "1.0.0+06fdb223d31e".
+
+    model_info["version"] alone is unchanged by retraining, so the digest is what
+    tells two deployed models apart in results and the audit log.
+    """
+    version = bundle["model_info"].get("version")
+    sha = bundle.get("source_sha256")
+    if sha is None and "models" in bundle and os.path.exists(bundle_path):
+        sha = file_sha256(bundle_path)
+    return f"{version}+{sha[:12]}" if sha else version
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# EXPORT
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def bundle_header(bundle, source_sha256=None):
+    """The JSON-safe bundle sections every artifact header carries."""
+    header = {section: _jsonable(bundle[section]) for section in HEADER_SECTIONS if section in bundle}
+    header["risk_thresholds"] = {k: float(bundle["risk_thresholds"][k]) for k in THRESHOLD_KEYS}
+    # Training category shares, the reference for the drift monitor
+    training = bundle["risk_thresholds"].get("validation_results", {}).get("training")
+    if training is not None:
+        header["risk_thresholds"]["validation_results"] = {"training": _jsonable(training)}
+    header["format_version"] = FORMAT_VERSION
+    header["source_sha256"] = source_sha256
+    return header
+
+
+def write_artifact(path, header, arrays):
+    """Save ``arrays`` as .npy files and ``header`` (plus their manifest) as header.json."""
+    os.makedirs(path, exist_ok=True)
+    manifest = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        target = os.path.join(path, f"{name}.npy")
+        with open(target + ".tmp", "wb") as f:
+            np.save(f, array)
+        os.replace(target + ".tmp", target)
+        manifest[name] = {"dtype": array.dtype.str, "shape": list(array.shape)}
+    header = dict(header, arrays=manifest)
+
+    # The header is written last so a partially exported directory never loads
+    tmp = os.path.join(path, HEADER_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, os.path.join(path, HEADER_FILE))
+    return header
+
+
+def export_artifact(bundle, path=ARTIFACT_PATH, source_sha256=None):
+    """Write the compiled model arrays and a JSON header describing the bundle."""
+    models = compile_models(bundle)
+    compiled = models.pop(PRIMARY_MODEL)
+    scaler = bundle["models"]["scaler"]
+    arrays = dict(compiled.arrays(), scaler_mean=scaler.mean_, scaler_scale=scaler.scale_)
+    header = bundle_header(bundle, source_sha256)
+    header["extra_models"] = {}
+    for name, model in models.items():
+        header["extra_models"][name] = "svc" if isinstance(model, CompiledSVC) else "calibrated"
+        arrays.update({f"{name}.{key}": array for key, array in model.arrays().items()})
+    return write_artifact(path, header, arrays)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LOAD
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def read_header(path=ARTIFACT_PATH):
+    with open(os.path.join(path, HEADER_FILE), encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format {header.get('format_version')!r}")
+    return header
+
+
+def artifact_is_current(path=ARTIFACT_PATH, bundle_path=None):
+    """True if an artifact exists and, when ``bundle_path`` is given, was exported from it."""
+    try:
+        header = read_header(path)
+    except (OSError, ValueError):
+        return False
+    if bundle_path is None or not os.path.exists(bundle_path):
+        return True
+    return header.get("source_sha256") == file_sha256(bundle_path)
+
+
+def load_arrays(path=ARTIFACT_PATH, header=None, mmap=True):
+    """Map every array listed in the header; returns {name: ndarray}."""
+    header = header or read_header(path)
+    mode = "r" if mmap else None
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        array = np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode, allow_pickle=False)
+        if list(array.shape) != spec["shape"] or array.dtype.str != spec["dtype"]:
+            raise ValueError(f"Artifact array {name!r} does not match its header")
+        arrays[name] = array
+    return arrays
+
+
+def load_artifact(path=ARTIFACT_PATH, mmap=True):
+    """Returns (header, CompiledSVM); the header mirrors the bundle keys used by the calculator."""
+    header = read_header(path)
+    check_features(header["model_info"]["features"])
+    arrays = load_arrays(path, header, mmap)
+    compiled = CompiledSVM(**{name: arrays[name] for name in CompiledSVM.ARRAY_NAMES})
+    return header, compiled
+
+
+def load_models(bundle_path=BUNDLE_PATH, artifact_path=ARTIFACT_PATH):
+    """(bundle or header, {name: compiled model}) for every model, like load_predictor."""
+    if not artifact_is_current(artifact_path, bundle_path):
+        bundle = load_bundle(bundle_path)
+        return bundle, compile_models(bundle)
+    header, primary = load_artifact(artifact_path)
+    arrays = load_arrays(artifact_path, header)
+    models = {PRIMARY_MODEL: primary}
+    for name, kind in header.get("extra_models", {}).items():
+        models[name] = MODEL_KINDS[kind](**{key: arrays[f"{name}.{key}"] for key in CompiledSVM.ARRAY_NAMES})
+    return header, models
+
+
+def load_predictor(bundle_path=BUNDLE_PATH, artifact_path=ARTIFACT_PATH):
+    """(bundle, CompiledSVM) from the artifact when it is current, else from the pickle.
+
+    The artifact header stands in for the bundle: it has the same "model_info",
+    "risk_thresholds" and "performance" entries but no sklearn "models".
+    """
+    if artifact_is_current(artifact_path, bundle_path):
+        return load_artifact(artifact_path)
+    bundle = load_bundle(bundle_path)
+    return bundle, CompiledSVM.from_bundle(bundle)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMMAND LINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the PULSE-IABP bundle as a native artifact.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="write model_artifact/ from model_bundle.pkl")
+    export.add_argument("--bundle", default=BUNDLE_PATH, help="model bundle (default: %(default)s)")
+    export.add_argument("--out", default=ARTIFACT_PATH, help="artifact directory (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    header = export_artifact(load_bundle(args.bundle), args.out, file_sha256(args.bundle))
+    n_support = header["arrays"]["support_vectors"]["shape"][0]
+    print(f"Exported {n_support} support vectors and {len(header['arrays'])} arrays to {args.out}/")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP AUDIT LOG
+# Append-only Parquet record of every scored request, written off the hot path
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Usage:
+#   PULSE_IABP_AUDIT_DIR=/var/lib/pulse_iabp/audit uvicorn pulse_iabp_service:app
+#   python pulse_iabp_audit.py query --start 2025-11-01 --end 2025-12-01 --category "HIGH RISK"
+#
+# Enabled by setting PULSE_IABP_AUDIT_DIR (requires pyarrow). The service, the
+# calculator and the JSONL stream hand each scored batch (raw inputs, probability,
+# category, model version, source) to AuditLog.record(), which only appends it to
+# a bounded in-memory queue. A background thread collects the queue into one
+# Parquet row group every PULSE_IABP_AUDIT_FLUSH_SECONDS (default 1) and starts a
+# new file after PULSE_IABP_AUDIT_ROTATE_ROWS rows or PULSE_IABP_AUDIT_ROTATE_SECONDS
+# seconds (defaults 1,000,000 and 60).
+#
+# Files are written as audit-<UTC start>-<pid>-<n>.parquet.inprogress and renamed
+# to .parquet when closed, so several processes can share one directory and
+# readers never see a half-written file. query_audit() reads the closed files;
+# records become visible when their file rotates or the process shuts down.
+#
+# A process that is killed leaves its current .inprogress file without a Parquet
+# footer, which loses at most one rotation interval of records. On start, the log
+# closes out .inprogress files of processes that are no longer running: complete
+# files are renamed to .parquet, files cut off mid-write to .parquet.damaged. Both
+# are counted in stats() ("recovered", "damaged") and damaged files are named in
+# last_error.
+#
+# Scoring never waits for the log: if the queue is full (PULSE_IABP_AUDIT_QUEUE
+# batches, default 10,000) the batch is dropped and counted in stats()["dropped"].
+
+import argparse
+import atexit
+import glob
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+AUDIT_DIR = os.environ.get("PULSE_IABP_AUDIT_DIR")
+QUEUE_BATCHES = int(os.environ.get("PULSE_IABP_AUDIT_QUEUE", "10000"))
+FLUSH_SECONDS = float(os.environ.get("PULSE_IABP_AUDIT_FLUSH_SECONDS", "1"))
+ROTATE_ROWS = int(os.environ.get("PULSE_IABP_AUDIT_ROTATE_ROWS", "1000000"))
+ROTATE_SECONDS = float(os.environ.get("PULSE_IABP_AUDIT_ROTATE_SECONDS", "60"))
+
+# Row group size that triggers a flush before FLUSH_SECONDS have passed
+FLUSH_ROWS = 65536
+
+FILE_PATTERN = "audit-*.parquet"
+IN_PROGRESS_SUFFIX = ".inprogress"
+DAMAGED_SUFFIX = ".damaged"
+
+_CLOSE = object()
+
+
+def _audit_schema(features):
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("timestamp", pa.timestamp("ms", tz="UTC")),
+            ("source", pa.string()),
+            ("model_version", pa.string()),
+        ]
+        + [(feature, pa.float64()) for feature in features]
+        + [
+            ("probability", pa.float64()),
+            ("risk_category", pa.string()),
+        ]
+    )
+
+
+class AuditLog:
+    """Background Parquet writer fed through a bounded queue of scored batches."""
+
+    def __init__(self, directory, features, queue_batches=QUEUE_BATCHES, flush_seconds=FLUSH_SECONDS,
+                 rotate_rows=ROTATE_ROWS, rotate_seconds=ROTATE_SECONDS):
+        self.directory = directory
+        self.features = list(features)
+        self.flush_seconds = flush_seconds
+        self.rotate_rows = rotate_rows
+        self.rotate_seconds = rotate_seconds
+        self.schema = _audit_schema(self.features)
+        self.last_error = None
+        self._queue = queue.Queue(maxsize=queue_batches)
+        self._counts = {"written": 0, "dropped": 0, "files": 0, "errors": 0, "recovered": 0, "damaged": 0}
+        # Request threads (dropped) and the writer thread update the counters
+        self._counts_lock = threading.Lock()
+        self._writer = None
+        self._path = None
+        self._file_rows = 0
+        self._file_opened = 0.0
+        self._sequence = 0
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, X, probs, categories, model_version, source):
+        """Queue one scored batch without blocking; False if it was dropped."""
+        item = (
+            time.time(), np.array(X, dtype=float, ndmin=2), np.asarray(probs, dtype=float),
+            list(categories), str(model_version), source,
+        )
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._count("dropped", len(item[1]))
+            return False
+        return True
+
+    def _count(self, name, n=1):
+        with self._counts_lock:
+            self._counts[name] += n
+
+    def stats(self):
+        with self._counts_lock:
+            counts = dict(self._counts)
+        return {**counts, "queued_batches": self._queue.qsize(), "last_error": self.last_error}
+
+    # ─── writer thread ───────────────────────────────────────────────────────
+
+    def start(self):
+        if self._thread is None:
+            self._guarded(self._recover)
+            self._thread = threading.Thread(target=self._run, name="pulse-iabp-audit", daemon=True)
+            self._thread.start()
+            # Streamlit and the CLIs exit without calling close(); don't lose the tail
+            atexit.register(self.close)
+        return self
+
+    def close(self, timeout=None):
+        """Write everything queued so far and close the current file."""
+        if self._thread is None:
+            return
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        pending, pending_rows = [], 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                item = None
+            if item is _CLOSE:
+                break
+            if item is not None:
+                pending.append(item)
+                pending_rows += len(item[1])
+            if pending and (pending_rows >= FLUSH_ROWS or time.monotonic() - last_flush >= self.flush_seconds):
+                self._flush(pending)
+                pending, pending_rows = [], 0
+                last_flush = time.monotonic()
+            if self._writer is not None and time.monotonic() - self._file_opened >= self.rotate_seconds:
+                self._guarded(self._close_file)
+        if pending:
+            self._flush(pending)
+        self._guarded(self._close_file)
+
+    def _guarded(self, action, *args):
+        # A full disk or a bad batch must not kill the writer thread
+        try:
+            action(*args)
+        except Exception as e:
+            self._count("errors")
+            self.last_error = f"{type(e).__name__}: {e}"
+            return False
+        return True
+
+    def _recover(self):
+        recovered, damaged = recover_in_progress(self.directory)
+        self._count("recovered", len(recovered))
+        self._count("damaged", len(damaged))
+        if damaged:
+            self.last_error = (f"{len(damaged)} audit file(s) cut off by an earlier crash: "
+                               + ", ".join(os.path.basename(path) for path in damaged))
+
+    def _flush(self, pending):
+        if self._guarded(self._write, pending):
+            self._count("written", sum(len(item[1]) for item in pending))
+
+    def _table(self, pending):
+        import pyarrow as pa
+
+        rows = np.array([len(item[1]) for item in pending])
+        X = np.vstack([item[1] for item in pending])
+        timestamps = np.repeat(np.array([int(item[0] * 1000) for item in pending]), rows)
+        columns = [
+            pa.array(timestamps, type=pa.int64()).cast(pa.timestamp("ms", tz="UTC")),
+            pa.array(np.repeat([item[5] for item in pending], rows), type=pa.string()),
+            pa.array(np.repeat([item[4] for item in pending], rows), type=pa.string()),
+        ]
+        columns += [pa.array(X[:, j]) for j in range(X.shape[1])]
+        columns += [
+            pa.array(np.concatenate([item[2] for item in pending])),
+            pa.array([category for item in pending for category in item[3]], type=pa.string()),
+        ]
+        return pa.Table.from_arrays(columns, schema=self.schema)
+
+    def _write(self, pending):
+        import pyarrow.parquet as pq
+
+        table = self._table(pending)
+        if self._writer is None:
+            started = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+            self._sequence += 1
+            name = f"audit-{started}-{os.getpid()}-{self._sequence}.parquet"
+            self._path = os.path.join(self.directory, name + IN_PROGRESS_SUFFIX)
+            self._writer = pq.ParquetWriter(self._path, self.schema, compression="zstd")
+            self._file_rows = 0
+            self._file_opened = time.monotonic()
+        self._writer.write_table(table)
+        self._file_rows += table.num_rows
+        if self._file_rows >= self.rotate_rows:
+            self._close_file()
+
+    def _close_file(self):
+        if self._writer is None:
+            return
+        writer, path = self._writer, self._path
+        self._writer = self._path = None
+        writer.close()
+        os.replace(path, path[:-len(IN_PROGRESS_SUFFIX)])
+        self._count("files")
+
+
+def _pid_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recover_in_progress(directory):
+    """Close out .inprogress files left by processes that are no longer running.
+
+    Returns (recovered, damaged) paths: files whose footer was written are renamed
+    to .parquet, unreadable ones to .parquet.damaged so they are reported only once.
+    This process has no file open yet, so its own pid counts as stopped (a restarted
+    container often reuses it).
+    """
+    import pyarrow.parquet as pq
+
+    recovered, damaged = [], []
+    for path in sorted(glob.glob(os.path.join(directory, FILE_PATTERN + IN_PROGRESS_SUFFIX))):
+        try:
+            pid = int(os.path.basename(path).split("-")[2])
+        except (IndexError, ValueError):
+            continue
+        if pid != os.getpid() and _pid_running(pid):
+            continue
+        final = path[:-len(IN_PROGRESS_SUFFIX)]
+        try:
+            pq.read_metadata(path)
+        except (OSError, ValueError):
+            os.replace(path, final + DAMAGED_SUFFIX)
+            damaged.append(final + DAMAGED_SUFFIX)
+        else:
+            os.replace(path, final)
+            recovered.append(final)
+    return recovered, damaged
+
+
+def audit_log_from_env(features):
+    """A started AuditLog when PULSE_IABP_AUDIT_DIR is set, else None."""
+    if not AUDIT_DIR:
+        return None
+    return AuditLog(AUDIT_DIR, features).start()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# QUERY
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _utc(value):
+    import pandas as pd
+
+    stamp = pd.Timestamp(value)
+    return stamp.tz_localize("UTC") if stamp.tzinfo is None else stamp.tz_convert("UTC")
+
+
+def _file_start(path):
+    # audit-<YYYYmmddTHHMMSS>-<pid>-<n>.parquet
+    return datetime.strptime(os.path.basename(path).split("-")[1], "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+
+
+def query_audit(directory=AUDIT_DIR, start=None, end=None, categories=None, columns=None):
+    """Audit records with start <= timestamp < end and, optionally, a risk category in ``categories``.
+
+    ``start``/``end`` accept anything pandas.Timestamp does (naive values are UTC).
+    Files that start after ``end`` are skipped by name; within the remaining files
+    the filter is pushed down to Parquet row-group statistics. Returns a DataFrame.
+    """
+    import pyarrow.dataset as ds
+
+    paths = sorted(glob.glob(os.path.join(directory, FILE_PATTERN)))
+    condition = None
+    if end is not None:
+        end = _utc(end)
+        paths = [path for path in paths if _file_start(path) < end]
+        condition = ds.field("timestamp") < end.to_pydatetime()
+    if start is not None:
+        after = ds.field("timestamp") >= _utc(start).to_pydatetime()
+        condition = after if condition is None else condition & after
+    if categories:
+        matches = ds.field("risk_category").isin(list(categories))
+        condition = matches if condition is None else condition & matches
+    if not paths:
+        return _empty_frame(columns)
+    table = ds.dataset(paths, format="parquet").to_table(columns=columns, filter=condition)
+    return table.to_pandas()
+
+
+def _empty_frame(columns):
+    import pandas as pd
+
+    return pd.DataFrame(columns=columns or ["timestamp", "source", "model_version", "probability", "risk_category"])
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMMAND LINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the PULSE-IABP prediction audit log.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    query = sub.add_parser("query", help="filter the log by date range and risk category")
+    query.add_argument("--dir", default=AUDIT_DIR, required=AUDIT_DIR is None,
+                       help="audit directory (default: $PULSE_IABP_AUDIT_DIR)")
+    query.add_argument("--start", help="first timestamp, inclusive (e.g. 2025-11-01 or 2025-11-01T08:00)")
+    query.add_argument("--end", help="last timestamp, exclusive")
+    query.add_argument("--category", action="append", dest="categories",
+                       help='risk category, e.g. "HIGH RISK"; repeat for several')
+    query.add_argument("--out", help="write the matching records to CSV or Parquet instead of a summary")
+    args = parser.parse_args(argv)
+
+    records = query_audit(args.dir, args.start, args.end, args.categories)
+    if args.out:
+        if args.out.lower().endswith((".parquet", ".pq")):
+            records.to_parquet(args.out, index=False)
+        else:
+            records.to_csv(args.out, index=False)
+        print(f"Wrote {len(records):,} records to {args.out}")
+        return 0
+
+    print(f"{len(records):,} records")
+    if len(records):
+        print(f"  from {records['timestamp'].min()} to {records['timestamp'].max()}")
+        for (source, category), n in records.groupby(["source", "risk_category"]).size().items():
+            print(f"  {source:<11} {category:<15} {n:>9,}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
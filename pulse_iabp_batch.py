@@ -0,0 +1,351 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP BATCH SCORING
+# Headless scoring of CSV/Parquet cohorts with the calibrated SVM
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Usage:
+#   python pulse_iabp_batch.py cohort.csv scored.csv
+#   python pulse_iabp_batch.py cohort.parquet scored.parquet --chunk-size 100000
+#   python pulse_iabp_batch.py registry.parquet scored.parquet --workers 8 --compiled
+#
+# The input must contain one column per feature in bundle["model_info"]["features"].
+# Any other columns (e.g. patient identifiers) are passed through unchanged.
+# Rows with missing feature values are written with an empty probability.
+# --explain adds contrib_<feature> columns: each feature's Shapley contribution to
+# the probability relative to the average training patient.
+# validation_code flags implausible rows (see pulse_iabp_validation): 1 = value out
+# of range, 2 = inconsistent fields, 4 = far from the training distribution.
+#
+# With --workers N the input is streamed in chunks to N processes, each loading
+# the model once (memory-mapped from model_artifact/ with --compiled, so the
+# pages are shared). At most 2N chunks are in flight, so memory stays bounded
+# whatever the input size. Each finished chunk is saved under <output>.parts/;
+# after a crash, rerunning the same command skips the chunks already scored.
+# Parts are only reused if the input file (size and mtime), the bundle and the
+# artifact header are unchanged since they were written.
+# The parts are then merged into <output> in input order and removed.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from pulse_iabp_artifact import ARTIFACT_PATH, HEADER_FILE, file_sha256, load_predictor
+from pulse_iabp_attribution import RBFShapExplainer
+from pulse_iabp_model import BUNDLE_PATH, load_bundle, risk_category_labels
+from pulse_iabp_validation import InputValidator
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# INPUT / OUTPUT
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in (".parquet", ".pq")
+
+
+def iter_cohort(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the cohort as DataFrame chunks of at most ``chunk_size`` rows.
+
+    An empty input still yields one empty chunk with its columns, so the scored
+    output is written with the full schema.
+    """
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        empty = True
+        for batch in parquet.iter_batches(batch_size=chunk_size):
+            empty = False
+            yield batch.to_pandas()
+        if empty:
+            yield parquet.schema_arrow.empty_table().to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class _CohortWriter:
+    """Append scored chunks to a CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._parquet_writer = None
+        self._header = True
+
+    def write(self, df):
+        if _is_parquet(self.path):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SCORING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def score_frame(df, model, features, thresholds, explainer=None, validator=None):
+    """Score one chunk; returns a copy with probability, risk_score and risk_category."""
+    missing = [f for f in features if f not in df.columns]
+    if missing:
+        raise ValueError(f"Cohort is missing feature columns: {', '.join(missing)}")
+
+    X = df[features].to_numpy(dtype=float)
+    complete = ~np.isnan(X).any(axis=1)
+
+    prob = np.full(len(df), np.nan)
+    if complete.any():
+        prob[complete] = model.predict_proba(X[complete])[:, 1]
+
+    out = df.copy()
+    out["probability"] = prob
+    out["risk_score"] = prob * 100
+    # Explicit string dtype so an empty chunk still gets a string column in Parquet
+    out["risk_category"] = pd.array(risk_category_labels(prob, thresholds), dtype="string")
+    if validator is not None:
+        out["validation_code"] = validator.check(X)
+    if explainer is not None:
+        contributions = np.full((len(df), len(features)), np.nan)
+        if complete.any():
+            contributions[complete] = explainer.explain(X[complete])
+        for j, feature in enumerate(features):
+            out[f"contrib_{feature}"] = contributions[:, j]
+    return out
+
+
+def _load_scorer(bundle_path, artifact_path, compiled, explain):
+    """(model, features, thresholds, explainer, validator) for score_frame."""
+    if compiled or explain:
+        bundle, model = load_predictor(bundle_path, artifact_path)
+    else:
+        bundle = load_bundle(bundle_path)
+        model = bundle["models"]["calibrated_svm"]
+    explainer = RBFShapExplainer(model) if explain else None
+    validator = InputValidator.from_bundle(bundle, artifact_path)
+    return model, bundle["model_info"]["features"], bundle["risk_thresholds"], explainer, validator
+
+
+def score_cohort(input_path, output_path, bundle_path=BUNDLE_PATH, chunk_size=DEFAULT_CHUNK_SIZE,
+                 compiled=False, artifact_path=ARTIFACT_PATH, explain=False):
+    """Score ``input_path`` into ``output_path``; returns (rows, incomplete rows, seconds)."""
+    scorer = _load_scorer(bundle_path, artifact_path, compiled, explain)
+
+    n_rows = n_incomplete = 0
+    start = time.perf_counter()
+    writer = _CohortWriter(output_path)
+    try:
+        for chunk in iter_cohort(input_path, chunk_size):
+            scored = score_frame(chunk, *scorer)
+            writer.write(scored)
+            n_rows += len(scored)
+            n_incomplete += int(scored["probability"].isna().sum())
+    finally:
+        writer.close()
+    return n_rows, n_incomplete, time.perf_counter() - start
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PARALLEL SCORING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_worker_scorer = None
+
+
+def _init_worker(bundle_path, artifact_path, compiled, explain):
+    global _worker_scorer
+    # One BLAS thread per process; the pool provides the parallelism
+    try:
+        from threadpoolctl import threadpool_limits
+
+        threadpool_limits(1)
+    except ImportError:
+        pass
+    _worker_scorer = _load_scorer(bundle_path, artifact_path, compiled, explain)
+
+
+def _score_part(chunk, part_path):
+    """Worker task: score one chunk and atomically write it as a part file."""
+    scored = score_frame(chunk, *_worker_scorer)
+    tmp = part_path + ".tmp"
+    if _is_parquet(part_path):
+        scored.to_parquet(tmp, index=False)
+    else:
+        scored.to_csv(tmp, index=False)
+    os.replace(tmp, part_path)
+    return len(scored), int(scored["probability"].isna().sum())
+
+
+def _optional_sha256(path):
+    return file_sha256(path) if os.path.exists(path) else None
+
+
+def _run_manifest(input_path, bundle_path, artifact_path, chunk_size, compiled, explain):
+    """Everything the saved parts depend on; a resumed run must match it exactly."""
+    stat = os.stat(input_path)
+    return {
+        "input": os.path.abspath(input_path),
+        "input_size": stat.st_size,
+        "input_mtime_ns": stat.st_mtime_ns,
+        "bundle_sha256": _optional_sha256(bundle_path),
+        "artifact_sha256": _optional_sha256(os.path.join(artifact_path, HEADER_FILE)),
+        "chunk_size": chunk_size,
+        "compiled": compiled,
+        "explain": explain,
+    }
+
+
+def _part_incomplete(part_path):
+    """Rows of a saved part that were not scored (empty probability)."""
+    if _is_parquet(part_path):
+        import pyarrow.parquet as pq
+
+        probs = pq.read_table(part_path, columns=["probability"]).column(0).to_numpy(zero_copy_only=False)
+    else:
+        probs = pd.read_csv(part_path, usecols=["probability"])["probability"].to_numpy(dtype=float)
+    return int(np.isnan(probs.astype(float)).sum())
+
+
+def _open_parts_dir(parts_dir, manifest):
+    """Create the parts directory, or check an existing one belongs to the same run."""
+    manifest_path = os.path.join(parts_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            if json.load(f) != manifest:
+                raise ValueError(f"{parts_dir} is from a run with different options, input or model; "
+                                 "remove it to start over")
+        return
+    os.makedirs(parts_dir, exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def _merge_parts(part_paths, output_path):
+    """Concatenate part files into ``output_path`` in order, replacing it atomically."""
+    tmp = output_path + ".tmp"
+    if _is_parquet(output_path):
+        import pyarrow.parquet as pq
+
+        writer = None
+        for part in part_paths:
+            table = pq.read_table(part)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema)
+            writer.write_table(table.cast(writer.schema))
+        if writer is not None:
+            writer.close()
+    else:
+        with open(tmp, "wb") as out:
+            for i, part in enumerate(part_paths):
+                with open(part, "rb") as f:
+                    if i > 0:
+                        f.readline()  # header
+                    shutil.copyfileobj(f, out)
+    os.replace(tmp, output_path)
+
+
+def score_cohort_parallel(input_path, output_path, workers, bundle_path=BUNDLE_PATH,
+                          chunk_size=DEFAULT_CHUNK_SIZE, compiled=False, artifact_path=ARTIFACT_PATH,
+                          explain=False):
+    """Resumable multi-process scoring; returns (rows, incomplete rows, seconds, resumed rows).
+
+    Rows and seconds cover the chunks scored by this run; incomplete rows cover the
+    whole output, including resumed parts.
+    """
+    parts_dir = output_path + ".parts"
+    suffix = ".parquet" if _is_parquet(output_path) else ".csv"
+    _open_parts_dir(parts_dir, _run_manifest(input_path, bundle_path, artifact_path, chunk_size,
+                                             compiled, explain))
+
+    n_rows = n_incomplete = n_resumed = 0
+    part_paths = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(bundle_path, artifact_path, compiled, explain)) as pool:
+        in_flight = set()
+        for index, chunk in enumerate(iter_cohort(input_path, chunk_size)):
+            part_path = os.path.join(parts_dir, f"part-{index:06d}{suffix}")
+            part_paths.append(part_path)
+            if os.path.exists(part_path):
+                n_resumed += len(chunk)
+                n_incomplete += _part_incomplete(part_path)
+                continue
+            if len(in_flight) >= 2 * workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rows, incomplete = future.result()
+                    n_rows += rows
+                    n_incomplete += incomplete
+            in_flight.add(pool.submit(_score_part, chunk, part_path))
+        for future in wait(in_flight).done:
+            rows, incomplete = future.result()
+            n_rows += rows
+            n_incomplete += incomplete
+
+    _merge_parts(part_paths, output_path)
+    shutil.rmtree(parts_dir)
+    return n_rows, n_incomplete, time.perf_counter() - start, n_resumed
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMMAND LINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a cohort with the PULSE-IABP model.")
+    parser.add_argument("input", help="cohort CSV or Parquet file")
+    parser.add_argument("output", help="scored CSV or Parquet file")
+    parser.add_argument("--bundle", default=BUNDLE_PATH, help="model bundle (default: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows per predict_proba call (default: %(default)s)")
+    parser.add_argument("--compiled", action="store_true",
+                        help="use the fused NumPy evaluator instead of sklearn")
+    parser.add_argument("--explain", action="store_true",
+                        help="add per-feature risk contributions (implies --compiled)")
+    parser.add_argument("--artifact", default=ARTIFACT_PATH,
+                        help="native artifact used by --compiled when current (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="scoring processes; >1 enables resumable parallel mode (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    n_resumed = 0
+    try:
+        if args.workers > 1:
+            n_rows, n_incomplete, seconds, n_resumed = score_cohort_parallel(
+                args.input, args.output, args.workers, args.bundle, args.chunk_size, args.compiled,
+                args.artifact, args.explain)
+        else:
+            n_rows, n_incomplete, seconds = score_cohort(
+                args.input, args.output, args.bundle, args.chunk_size, args.compiled, args.artifact,
+                args.explain)
+    except ValueError as e:
+        parser.exit(2, f"error: {e}\n")
+
+    if n_resumed:
+        print(f"Resumed {n_resumed:,} rows scored by a previous run", file=sys.stderr)
+    rate = n_rows / seconds if seconds > 0 else float("inf")
+    print(f"Scored {n_rows:,} rows in {seconds:.2f} s ({rate:,.0f} rows/s)", file=sys.stderr)
+    if n_incomplete:
+        print(f"{n_incomplete:,} rows had missing feature values and were not scored", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
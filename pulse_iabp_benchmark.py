@@ -0,0 +1,240 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP BENCHMARKS
+# Cold start, latency, throughput and memory of the scoring engines
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Usage:
+#   python pulse_iabp_benchmark.py --out bench.json
+#   python pulse_iabp_benchmark.py --quick            # fewer repeats, for CI smoke runs
+#
+# Synthetic patients are drawn uniformly inside the calculator's slider ranges
+# with a fixed seed, so results from different commits are directly comparable.
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from pulse_iabp_artifact import ARTIFACT_PATH, artifact_is_current
+from pulse_iabp_compiled import CompiledSVM
+from pulse_iabp_model import BUNDLE_PATH, SLIDER_RANGES, load_bundle
+
+BATCH_SIZES = (1, 10, 100, 1_000, 10_000)
+
+_COLD_LOAD_SCRIPTS = {
+    "bundle_pickle": "from pulse_iabp_model import load_bundle; load_bundle({bundle_path!r})",
+    "artifact_mmap": "from pulse_iabp_artifact import load_artifact; load_artifact({artifact_path!r})",
+}
+
+_ENGINES = {
+    "sklearn": lambda bundle: bundle["models"]["calibrated_svm"].predict_proba,
+    "compiled": lambda bundle: CompiledSVM.from_bundle(bundle).predict_proba,
+}
+
+_MEMORY_SCRIPT = (
+    "import json; from pulse_iabp_benchmark import scoring_memory; "
+    "print(json.dumps(scoring_memory({engine!r}, {bundle_path!r}, {rows}, {seed})))"
+)
+
+
+def synthetic_patients(n, features, seed=0):
+    """``n`` rows drawn on the slider grid, columns ordered as ``features``."""
+    rng = np.random.default_rng(seed)
+    X = np.empty((n, len(features)))
+    for j, feature in enumerate(features):
+        low, high, step = SLIDER_RANGES[feature]
+        X[:, j] = low + step * rng.integers(0, round((high - low) / step) + 1, size=n)
+    return X
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# MEASUREMENTS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _run_fresh(code):
+    """stdout of ``code`` run in a fresh interpreter from this directory."""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.run([sys.executable, "-c", code], cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+
+def cold_load_seconds(kind, repeats, bundle_path=BUNDLE_PATH, artifact_path=ARTIFACT_PATH):
+    """Import + load time in fresh interpreters (median of ``repeats``)."""
+    load = _COLD_LOAD_SCRIPTS[kind].format(bundle_path=os.path.abspath(bundle_path),
+                                           artifact_path=os.path.abspath(artifact_path))
+    code = f"import time; t = time.perf_counter(); {load}; print(time.perf_counter() - t)"
+    samples = [float(_run_fresh(code)) for _ in range(repeats)]
+    return {"median_s": float(np.median(samples)), "min_s": float(np.min(samples)), "repeats": repeats}
+
+
+def single_row_latency(predict_proba, X, repeats):
+    """p50/p99 of one-row predict_proba calls, in milliseconds."""
+    timings = np.empty(repeats)
+    for i in range(repeats):
+        row = X[i % len(X):i % len(X) + 1]
+        start = time.perf_counter()
+        predict_proba(row)
+        timings[i] = time.perf_counter() - start
+    ms = timings * 1e3
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "repeats": repeats,
+    }
+
+
+def throughput(predict_proba, X, batch_sizes, min_rows):
+    """Rows per second as a function of batch size."""
+    results = []
+    for batch_size in batch_sizes:
+        n_calls = max(1, min_rows // batch_size)
+        start = time.perf_counter()
+        for i in range(n_calls):
+            offset = (i * batch_size) % (len(X) - batch_size + 1)
+            predict_proba(X[offset:offset + batch_size])
+        seconds = time.perf_counter() - start
+        results.append({
+            "batch_size": batch_size,
+            "rows_per_s": n_calls * batch_size / seconds,
+            "ms_per_batch": seconds / n_calls * 1e3,
+        })
+    return results
+
+
+def _max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def _proc_status_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise OSError(f"{field} not in /proc/self/status")
+
+
+def _reset_peak_rss():
+    """Reset the kernel's RSS high-water mark (Linux ≥ 4.0); False where unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def scoring_memory(engine, bundle_path, rows, seed):
+    """Resident memory while scoring ``rows`` patients in one call, C allocations included.
+
+    On Linux the high-water mark (VmHWM) is reset just before the call, so scoring_mb
+    is the call's own peak above the resident baseline. Elsewhere only ru_maxrss is
+    available; it cannot be reset, so scoring_mb is then a lower bound (0 if
+    loading the model peaked higher than scoring).
+    """
+    bundle = load_bundle(bundle_path)
+    predict_proba = _ENGINES[engine](bundle)
+    X = synthetic_patients(rows, bundle["model_info"]["features"], seed)
+    if _reset_peak_rss():
+        method, before = "VmHWM", _proc_status_mb("VmRSS")
+        predict_proba(X)
+        after = _proc_status_mb("VmHWM")
+    else:
+        method, before = "ru_maxrss", _max_rss_mb()
+        predict_proba(X)
+        after = _max_rss_mb()
+    return {"rows": rows, "method": method, "baseline_rss_mb": before, "peak_rss_mb": after,
+            "scoring_mb": after - before}
+
+
+def peak_memory(engine, bundle_path, rows, seed):
+    """scoring_memory() measured in a fresh interpreter, so engines do not share a high-water mark."""
+    code = _MEMORY_SCRIPT.format(engine=engine, bundle_path=os.path.abspath(bundle_path), rows=rows, seed=seed)
+    return json.loads(_run_fresh(code))
+
+
+def _environment():
+    import sklearn
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scikit_learn": sklearn.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_benchmarks(quick=False, seed=0, bundle_path=BUNDLE_PATH):
+    bundle = load_bundle(bundle_path)
+    features = bundle["model_info"]["features"]
+    engines = {name: build(bundle) for name, build in _ENGINES.items()}
+    X = synthetic_patients(max(BATCH_SIZES), features, seed)
+    latency_repeats = 200 if quick else 2000
+    cold_repeats = 2 if quick else 5
+    min_rows = 10_000 if quick else 50_000
+
+    cold_kinds = ["bundle_pickle"]
+    if artifact_is_current(ARTIFACT_PATH, bundle_path):
+        cold_kinds.append("artifact_mmap")
+
+    results = {
+        "environment": _environment(),
+        "config": {"seed": seed, "quick": quick, "batch_sizes": list(BATCH_SIZES)},
+        "cold_load": {kind: cold_load_seconds(kind, cold_repeats, bundle_path) for kind in cold_kinds},
+        "engines": {},
+    }
+    for name, predict_proba in engines.items():
+        results["engines"][name] = {
+            "single_row": single_row_latency(predict_proba, X, latency_repeats),
+            "throughput": throughput(predict_proba, X, BATCH_SIZES, min_rows),
+            "memory": peak_memory(name, bundle_path, len(X), seed),
+        }
+    results["max_rss_mb"] = _max_rss_mb()
+    return results
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMMAND LINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PULSE-IABP scoring.")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON output (default: %(default)s)")
+    parser.add_argument("--bundle", default=BUNDLE_PATH, help="model bundle (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="synthetic patient seed (default: %(default)s)")
+    parser.add_argument("--quick", action="store_true", help="fewer repeats for smoke runs")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.quick, args.seed, args.bundle)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    for kind, stats in results["cold_load"].items():
+        print(f"cold load   {kind:<14} {stats['median_s'] * 1e3:8.1f} ms")
+    for name, engine in results["engines"].items():
+        single = engine["single_row"]
+        best = max(engine["throughput"], key=lambda r: r["rows_per_s"])
+        print(f"{name:<11} p50 {single['p50_ms']:.3f} ms  p99 {single['p99_ms']:.3f} ms  "
+              f"peak {best['rows_per_s']:,.0f} rows/s (batch {best['batch_size']})  "
+              f"memory +{engine['memory']['scoring_mb']:.1f} MB (peak RSS {engine['memory']['peak_rss_mb']:.0f} MB)")
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
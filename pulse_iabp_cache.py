@@ -0,0 +1,113 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP PREDICTION CACHE
+# Bounded LRU + TTL cache keyed on the feature vector
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Streamlit reruns the page on every widget change, so the same inputs are
+# scored again and again. PredictionCache wraps any predict_proba. Rows that lie
+# on the calculator's slider grid are keyed on their grid position, so values
+# that differ only by float noise (7.3 vs 7.300000000000001) share an entry;
+# any other row is keyed on its exact value. Rows are always scored as given,
+# so a cached probability matches the uncached model for the same input.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from pulse_iabp_model import FEATURE_SPECS
+
+DEFAULT_MAXSIZE = int(os.environ.get("PULSE_IABP_CACHE_SIZE", "4096"))
+DEFAULT_TTL_SECONDS = float(os.environ.get("PULSE_IABP_CACHE_TTL", "3600"))
+
+# Step of each st.slider / radio in pulse_iabp_calculator.py
+FEATURE_RESOLUTION = {spec.name: spec.step for spec in FEATURE_SPECS}
+
+# Distance from a grid point, in slider steps, still treated as on the grid
+GRID_TOLERANCE = 1e-9
+
+
+class PredictionCache:
+    """Thread-safe LRU cache in front of ``predict_proba`` with hit/miss counters."""
+
+    def __init__(self, predict_proba, features, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL_SECONDS,
+                 resolution=FEATURE_RESOLUTION, clock=time.monotonic):
+        self._predict_proba = predict_proba
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        # Features without a known resolution are keyed on their exact value
+        self._steps = np.array([resolution.get(f, np.nan) for f in features], dtype=float)
+        self._quantized = ~np.isnan(self._steps)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _keys(self, X):
+        """Grid position for rows on the slider grid, exact value for the rest."""
+        units = X[:, self._quantized] / self._steps[self._quantized]
+        grid = X.copy()
+        grid[:, self._quantized] = np.round(units)
+        on_grid = (np.abs(units - grid[:, self._quantized]) <= GRID_TOLERANCE).all(axis=1)
+        return [b"g" + g.tobytes() if exact else b"x" + x.tobytes()
+                for g, x, exact in zip(grid, X, on_grid)]
+
+    def predict_proba(self, X):
+        """Same contract as the wrapped model: returns (n, 2) probabilities."""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        keys = self._keys(X)
+        p1 = np.empty(len(keys))
+        unique = {}
+        now = self._clock()
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    p1[i] = entry[1]
+                    self.hits += 1
+                elif key in unique:
+                    # Repeated within this call: scored once with the first copy
+                    self.hits += 1
+                else:
+                    unique[key] = i
+                    self.misses += 1
+
+        if unique:
+            fresh = self._predict_proba(X[list(unique.values())])[:, 1]
+            scored = dict(zip(unique, fresh))
+            for i, key in enumerate(keys):
+                if key in scored:
+                    p1[i] = scored[key]
+            self._store(scored, now + self.ttl)
+
+        return np.column_stack([1.0 - p1, p1])
+
+    def _store(self, scored, expires_at):
+        with self._lock:
+            for key, prob in scored.items():
+                self._entries[key] = (expires_at, float(prob))
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+            }
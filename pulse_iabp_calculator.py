@@ -7,11 +7,29 @@
 # Developed by: Z. S. Zampawala et al. (2025)
 # ═══════════════════════════════════════════════════════════════════════════════
 
+import time
+from contextlib import nullcontext
+from itertools import groupby
+
+import altair as alt
 import streamlit as st
-import pickle
 import numpy as np
 import pandas as pd
 
+from pulse_iabp_attribution import RBFShapExplainer
+from pulse_iabp_audit import audit_log_from_env
+from pulse_iabp_cache import PredictionCache
+from pulse_iabp_metrics import metrics
+from pulse_iabp_model import (
+    FEATURE_LABELS, FEATURE_REGISTRY, FEATURE_SPECS, RISK_CATEGORIES, assemble_features, get_risk_category,
+    risk_cutoffs,
+)
+from pulse_iabp_registry import ModelRegistry
+from pulse_iabp_sensitivity import sensitivity_curves
+from pulse_iabp_validation import InputValidator
+
+rerun_start = time.perf_counter()
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # PAGE CONFIGURATION
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -209,34 +227,116 @@ st.markdown("""
 # ═══════════════════════════════════════════════════════════════════════════════
 
 @st.cache_resource
-def load_model():
+def load_registry():
+    """Models shared by every session; a re-exported model_artifact/ is swapped in live."""
+    registry = ModelRegistry()
     try:
-        with open("model_bundle.pkl", "rb") as f:
-            return pickle.load(f)
+        registry.load()
     except Exception as e:
         st.error(f"Error loading model: {e}")
         st.stop()
+    registry.start()
+    return registry
 
-bundle = load_model()
-model = bundle["models"]["calibrated_svm"]  
-features = bundle["model_info"]["features"]
-thresholds = bundle["risk_thresholds"]
 
+# The resources below are rebuilt when the registry loads a new model version
 
-# ═══════════════════════════════════════════════════════════════════════════════
-# HELPER FUNCTIONS
-# ═══════════════════════════════════════════════════════════════════════════════
+@st.cache_resource(max_entries=1)
+def load_prediction_cache(fingerprint, _model, _features):
+    """Shared across sessions so repeated inputs skip the kernel evaluation."""
+    return PredictionCache(_model.predict_proba, _features)
+
+
+@st.cache_resource(max_entries=1)
+def load_explainer(fingerprint, _model):
+    """Risk-contributor attribution for the compiled predictor."""
+    return RBFShapExplainer(_model)
+
+
+@st.cache_resource(max_entries=1)
+def load_validator(fingerprint, _bundle):
+    """Consistency and plausibility checks against the training distribution."""
+    return InputValidator.from_bundle(_bundle)
+
+
+@st.cache_resource
+def load_audit_log(_features):
+    """Process-wide audit writer (None unless PULSE_IABP_AUDIT_DIR is set)."""
+    return audit_log_from_env(_features)
+
+
+@st.cache_data(max_entries=4)
+def risk_scale_html(low, medium, high):
+    """Boundary markers, colour segments and segment labels for the risk progress bar."""
+    bounds = [0.0, low * 100, medium * 100, high * 100, 100.0]
+    markers = "\n".join(
+        f'            <span style="position: absolute; left: {b:g}%; transform: translateX(-50%); '
+        f'font-size: 0.9rem; color: #6c757d;">{b:g}</span>'
+        for b in bounds[1:-1]
+    )
+    segments = "\n".join(
+        f'                <div style="width: {hi - lo:g}%; background-color: {color}; height: 100%;"></div>'
+        for lo, hi, (_, color, _) in zip(bounds, bounds[1:], RISK_CATEGORIES)
+    )
+    labels = "\n".join(
+        f'                <span style="position: absolute; left: {(lo + hi) / 2:g}%; transform: translateX(-50%); '
+        f'font-size: 0.7rem; font-weight: 700; color: white; text-shadow: 1px 1px 2px rgba(0,0,0,0.7);">'
+        f'{label.removesuffix(" RISK")}</span>'
+        for lo, hi, (label, _, _) in zip(bounds, bounds[1:], RISK_CATEGORIES)
+    )
+    return markers, segments, labels
+
+
+@st.cache_data(max_entries=1)
+def sidebar_markdown(fingerprint, _bundle):
+    """Model information, built once per model version."""
+    lines = [
+        "### ℹ️ MODEL INFORMATION",
+        "**ALGORITHM SPECIFICATIONS:**  ",
+        "• Model: Support Vector Machine (RBF kernel)  ",
+        "• Calibration: Platt scaling (sigmoid)  ",
+        "• Feature Selection: 16 clinical variables",
+        "",
+        "**STUDY POPULATION:**  ",
+        "• Training Cohort: n=476 (Tongji Hospital, Wuhan, China)  ",
+        "• Validation Cohort: n=354 (MIMIC-IV, Boston, USA)  ",
+        "• Inclusion: AMI patients undergoing IABP  ",
+        "• Follow-up: 12 months",
+        "",
+        "**PERFORMANCE METRICS:**  ",
+    ]
+    # The artifact header has no cochran_armitage_test; the published result is p < 0.001
+    trend = _bundle.get('cochran_armitage_test', {}).get('external')
+    trend_p = "p < 0.001" if trend is None or trend['p_value'] < 0.001 else f"p = {trend['p_value']:.3f}"
+    if 'performance' in _bundle and 'phase_b' in _bundle['performance']:
+        perf = _bundle['performance']['phase_b']['external_confirmatory']
+        lines.append(f"• External AUC: {perf['auc']:.3f}  ")
+        lines.append(f"• Brier Score: {perf['brier']:.3f}  ")
+        if 'calibration' in perf:
+            lines.append(f"• Calibration Slope: {perf['calibration']['slope']:.3f}")
+    lines += [
+        "",
+        "**RISK STRATIFICATION:**  ",
+        f"• Thresholds: {', '.join(f'{c * 100:g}%' for c in risk_cutoffs(_bundle['risk_thresholds']))}  ",
+        f"• Trend test: {trend_p}",
+        "",
+        "---",
+        "",
+        "### 📄 CITATION INFORMATION",
+        "Z. S. Zampawala, et al. (2025). External Validation of a Machine Learning Model for One-Year Mortality "
+        "in IABP-Treated Acute Myocardial Infarction: The PULSE-IABP Risk Score "
+        "[Journal Name]. [In Press].",
+        "",
+        "DOI: [To be assigned]",
+        "",
+        "© 2025 Z. S. Zampawala et al. All rights reserved.",
+    ]
+    return "\n".join(lines)
+
+
+# Loaded before any markup, so a broken model stops the page with an error
+models = load_registry().current
 
-def get_risk_category(prob):
-    """Get risk category based on Step 17A thresholds (0.25, 0.45, 0.70)""" 
-    if prob < thresholds['low']:
-        return "LOW RISK", "#28a745", "🟢"
-    elif prob < thresholds['medium']:
-        return "MEDIUM RISK", "#ffc107", "🟡"
-    elif prob < thresholds['high']:
-        return "HIGH RISK", "#fd7e14", "🟠"
-    else:
-        return "VERY HIGH RISK", "#dc3545", "🔴"
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # HEADER
@@ -250,149 +350,125 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ═══════════════════════════════════════════════════════════════════════════════
-# PATIENT DEMOGRAPHICS
-# ═══════════════════════════════════════════════════════════════════════════════
-
-st.markdown('<div class="section-header">PATIENT DEMOGRAPHICS</div>', unsafe_allow_html=True)
-age = st.slider("Age (years)", 18, 100, 65, key="age")
-
-# ═══════════════════════════════════════════════════════════════════════════════
-# PHARMACOTHERAPY
-# ═══════════════════════════════════════════════════════════════════════════════
-
-st.markdown('<div class="section-header">PHARMACOTHERAPY</div>', unsafe_allow_html=True)
-
-col1, col2, col3 = st.columns(3)
-
-with col1:
-    beta_blocker = st.radio("β-Blocker Therapy", ["No", "Yes"], index=1, key="bb", horizontal=True)
-
-with col2:
-    ace_inhibitor = st.radio("ACE Inhibitor Therapy", ["No", "Yes"], index=0, key="acei", horizontal=True)
-
-with col3:
-    ticagrelor = st.radio("Ticagrelor Therapy", ["No", "Yes"], index=0, key="tica", horizontal=True)
-
-# ═══════════════════════════════════════════════════════════════════════════════
-# CRITICAL CARE INTERVENTIONS
-# ═══════════════════════════════════════════════════════════════════════════════
-
-st.markdown('<div class="section-header">CRITICAL CARE INTERVENTIONS</div>', unsafe_allow_html=True)
-
-col1, col2, col3 = st.columns(3)
-
-with col1:
-    invasive_vent = st.radio("Invasive Mechanical Ventilation", ["No", "Yes"], index=0, key="vent", horizontal=True)
-
-with col2:
-    cpr = st.radio("Cardiopulmonary Resuscitation", ["No", "Yes"], index=0, key="cpr", horizontal=True)
-
-with col3:
-    crrt = st.radio("Continuous Renal Replacement", ["No", "Yes"], index=0, key="crrt", horizontal=True)
-
-# ═══════════════════════════════════════════════════════════════════════════════
-# HEMATOLOGY
+# PATIENT INPUTS
 # ═══════════════════════════════════════════════════════════════════════════════
 
-st.markdown('<div class="section-header">HEMATOLOGY</div>', unsafe_allow_html=True)
-
-col1, col2 = st.columns(2)
-
-with col1:
-    hgb_min = st.slider("Hemoglobin, minimum (g/L)", 40, 180, 110, key="hgb_min")
-    hgb_max = st.slider("Hemoglobin, peak (g/L)", 40, 180, 135, key="hgb_max")
-    rbc_max = st.slider("RBC count, peak (×10¹²/L)", 2.0, 7.0, 4.5, 0.1, key="rbc")
-
-with col2:
-    neut_abs = st.slider("Neutrophils, minimum (×10⁹/L)", 0.0, 30.0, 5.0, 0.1, key="neut_abs")
-    neut_pct = st.slider("Neutrophils, minimum (%)", 0, 100, 70, key="neut_pct")
-
-# ═══════════════════════════════════════════════════════════════════════════════
-# RENAL FUNCTION
-# ═══════════════════════════════════════════════════════════════════════════════
+def feature_widget(spec):
+    """No/Yes radio or slider for one FeatureSpec; returns the encoded value."""
+    if spec.is_binary:
+        return st.radio(spec.label, tuple(range(len(spec.choices))), index=spec.default,
+                        format_func=spec.display, key=spec.key, horizontal=True)
+    return st.slider(spec.label, spec.low, spec.high, spec.default, spec.step, key=spec.key)
 
-st.markdown('<div class="section-header">RENAL FUNCTION</div>', unsafe_allow_html=True)
 
-egfr = st.slider("eGFR CKD-EPI 2021 (mL/min/1.73m²)", 5, 120, 75, key="egfr")
+def patient_inputs():
+    """Every input widget, grouped by section; returns {feature: value}."""
+    inputs = {}
+    for section, specs in groupby(FEATURE_SPECS, key=lambda spec: spec.section):
+        specs = list(specs)
+        st.markdown(f'<div class="section-header">{section}</div>', unsafe_allow_html=True)
+        n_columns = max(spec.column for spec in specs) + 1
+        columns = st.columns(n_columns) if n_columns > 1 else None
+        for spec in specs:
+            with columns[spec.column] if columns else nullcontext():
+                inputs[spec.name] = feature_widget(spec)
+    return inputs
 
 # ═══════════════════════════════════════════════════════════════════════════════
-# METABOLIC & ELECTROLYTES
-# ═══════════════════════════════════════════════════════════════════════════════
-
-st.markdown('<div class="section-header">METABOLIC & ELECTROLYTES</div>', unsafe_allow_html=True)
-
-col1, col2, col3 = st.columns(3)
-
-with col1:
-    glucose_min = st.slider("Glucose, minimum (mmol/L)", 1.5, 30.0, 6.0, 0.1, key="glucose")
-
-with col2:
-    lactate_max = st.slider("Lactate, peak (mmol/L)", 0.0, 20.0, 2.5, 0.1, key="lactate")
-
-with col3:
-    sodium_max = st.slider("Sodium, peak (mmol/L)", 115, 165, 140, key="sodium")
-
-# ═══════════════════════════════════════════════════════════════════════════════
-# CALCULATE BUTTON
+# RESULTS SECTION
 # ═══════════════════════════════════════════════════════════════════════════════
 
-calc_btn = st.button("🔬 CALCULATE RISK SCORE")
+@st.cache_data(max_entries=4)
+def sensitivity_spec(labels, boundaries):
+    """Vega-Lite spec faceting every sensitivity curve; built once, only the data changes per rerun."""
+    base = alt.Chart().encode(
+        x=alt.X("value:Q", title=None),
+        y=alt.Y("risk_score:Q", title="Risk score", scale=alt.Scale(domain=[0, 100])),
+    )
+    rules = [alt.Chart().mark_rule(strokeDash=[4, 4], color="#6c757d").encode(y=alt.datum(b)) for b in boundaries]
+    line = base.mark_line(color="#667eea").transform_filter("!datum.patient")
+    point = base.mark_circle(size=70, color="#2c3e50", opacity=1).transform_filter("datum.patient")
+    chart = alt.layer(*rules, line, point, data=alt.NamedData("sensitivity")).properties(
+        width=190, height=150,
+    ).facet(
+        facet=alt.Facet("feature:N", title=None, sort=list(labels)), columns=3,
+    ).resolve_scale(x="independent")
+    spec = chart.to_dict()
+    del spec["data"]  # supplied as a DataFrame by st.vega_lite_chart
+    return spec
+
+
+def sensitivity_data(curves, inputs, risk_score):
+    """One long DataFrame: every curve's points, then the patient's point on each curve."""
+    names = list(curves)
+    lengths = [len(values) for values, _ in curves.values()]
+    return pd.DataFrame({
+        "feature": np.repeat([FEATURE_LABELS[name] for name in names] * 2, lengths + [1] * len(names)),
+        "value": np.concatenate([values for values, _ in curves.values()] + [[inputs[name] for name in names]]),
+        "risk_score": np.concatenate([probs * 100 for _, probs in curves.values()] + [[risk_score] * len(names)]),
+        "patient": np.repeat([False, True], [sum(lengths), len(names)]),
+    })
+
+
+def compute_results(models, inputs):
+    """Score one patient and compute every results panel; runs once per CALCULATE press."""
+    bundle, model, features = models.bundle, models.primary, models.features
+    thresholds = bundle["risk_thresholds"]
+    prediction_cache = load_prediction_cache(models.fingerprint, model, features)
+    validator = load_validator(models.fingerprint, bundle)
+    
+    # Assemble the widget values in the model's feature order (RAW - pipeline handles scaling)
+    with metrics.stage("array_construction"):
+        X = assemble_features(inputs, features)
+    
+    # Scaling, kernel evaluation and calibration (timed inside the predictor)
+    with metrics.stage("predict"):
+        prob = prediction_cache.predict_proba(X)[0, 1]
+    
+    category = get_risk_category(prob, thresholds)[0]
+    metrics.count_prediction(category)
+    audit = load_audit_log(features)
+    if audit is not None:
+        audit.record(X, [prob], [category], models.version, "calculator")
+    
+    # Risk contributors: features pushing this patient above the reference patient.
+    # Attribution needs the compiled predictor, so the sklearn fallback has none.
+    contributors = []
+    if models.compiled:
+        contributors = load_explainer(models.fingerprint, model).top_contributors(X[0], features)
+    
+    return {
+        "models": models,
+        "inputs": dict(inputs),
+        "prob": prob,
+        # Implausible combinations are still scored, but flagged
+        "findings": validator.messages(X[0]),
+        "contributors": contributors,
+        # Every model in the bundle, scored in one pass for comparison
+        "comparison": models.predict_all(X),
+        # Sensitivity curves: every continuous input swept in one batched model call
+        "curves": sensitivity_curves(model.predict_proba, X[0], features),
+    }
 
-# ═══════════════════════════════════════════════════════════════════════════════
-# RESULTS SECTION
-# ═══════════════════════════════════════════════════════════════════════════════
 
-if calc_btn:
-    # Map inputs to model features
-    feat_map = {}
-    
-    for feature_name in features:
-        if feature_name == "age":
-            feat_map[feature_name] = age
-        elif feature_name == "beta_blocker_use":
-            feat_map[feature_name] = int(beta_blocker == "Yes")
-        elif feature_name == "acei_use":
-            feat_map[feature_name] = int(ace_inhibitor == "Yes")
-        elif feature_name == "ticagrelor_use":
-            feat_map[feature_name] = int(ticagrelor == "Yes")
-        elif feature_name == "invasive_ventilation":
-            feat_map[feature_name] = int(invasive_vent == "Yes")
-        elif feature_name == "underwent_CPR":
-            feat_map[feature_name] = int(cpr == "Yes")
-        elif feature_name == "underwent_CRRT":
-            feat_map[feature_name] = int(crrt == "Yes")
-        elif feature_name == "hemoglobin_min":
-            feat_map[feature_name] = hgb_min
-        elif feature_name == "hemoglobin_max":
-            feat_map[feature_name] = hgb_max
-        elif feature_name == "rbc_count_max":
-            feat_map[feature_name] = rbc_max
-        elif feature_name == "neutrophils_abs_min":
-            feat_map[feature_name] = neut_abs
-        elif feature_name == "neutrophils_pct_min":
-            feat_map[feature_name] = neut_pct
-        elif feature_name == "eGFR_CKD_EPI_21":
-            feat_map[feature_name] = egfr
-        elif feature_name == "glucose_min":
-            feat_map[feature_name] = glucose_min
-        elif feature_name == "lactate_max":
-            feat_map[feature_name] = lactate_max
-        elif feature_name == "sodium_max":
-            feat_map[feature_name] = sodium_max
-        else:
-            feat_map[feature_name] = 0
-    
-    # Create input array (RAW - pipeline handles scaling)
-    X = np.array([[feat_map[f] for f in features]])
-    
-    # Scaling 
-    prob = model.predict_proba(X)[0, 1]
+def show_results(result, current_inputs):
+    """Render the result area from compute_results(); nothing is rescored here."""
+    models, inputs, prob = result["models"], result["inputs"], result["prob"]
+    thresholds = models.bundle["risk_thresholds"]
+    if current_inputs != inputs:
+        st.info("The inputs have changed since this result was calculated. "
+                "Press **CALCULATE RISK SCORE** to update it.")
     
     # Calculate risk score (probability × 100)
     risk_score = prob * 100
     
     # Get category
-    category, color, emoji = get_risk_category(prob)
+    category, color, emoji = get_risk_category(prob, thresholds)
+    render_start = time.perf_counter()
+    
+    findings = result["findings"]
+    if findings:
+        st.warning("**Please check these inputs:**  \n" + "  \n".join(f"- {f}" for f in findings))
     
     # Display results
     st.markdown(f"""
@@ -403,31 +479,24 @@ if calc_btn:
     </div>
     """, unsafe_allow_html=True)
     
-       # Progress bar visualization
+       # Progress bar visualization, drawn from the bundle's thresholds
+    markers, segments, labels = risk_scale_html(thresholds['low'], thresholds['medium'], thresholds['high'])
     progress_bar_html = f"""
     <div style="margin: 2rem 0;">
         <!-- Number markers positioned EXACTLY at color boundaries -->
         <div style="position: relative; margin-bottom: 0.5rem; height: 20px;">
             <span style="position: absolute; left: 0%; transform: translateX(0%); font-size: 0.9rem; color: #6c757d;">0</span>
-            <span style="position: absolute; left: 25%; transform: translateX(-50%); font-size: 0.9rem; color: #6c757d;">25</span>
-            <span style="position: absolute; left: 45%; transform: translateX(-50%); font-size: 0.9rem; color: #6c757d;">45</span>
-            <span style="position: absolute; left: 70%; transform: translateX(-50%); font-size: 0.9rem; color: #6c757d;">70</span>
+{markers}
             <span style="position: absolute; left: 100%; transform: translateX(-100%); font-size: 0.9rem; color: #6c757d;">100</span>
         </div>
         <div style="position: relative; height: 60px; padding: 10px 0;">
             <!-- Color bar with precise breakpoints -->
             <div style="width: 100%; height: 40px; border-radius: 20px; position: absolute; top: 10px; left: 0; display: flex; overflow: hidden;">
-                <div style="width: 25%; background-color: #28a745; height: 100%;"></div>
-                <div style="width: 20%; background-color: #ffc107; height: 100%;"></div>
-                <div style="width: 25%; background-color: #fd7e14; height: 100%;"></div>
-                <div style="width: 30%; background-color: #dc3545; height: 100%;"></div>
+{segments}
             </div>
             <!-- Labels overlay -->
             <div style="position: absolute; top: 10px; left: 0; width: 100%; height: 40px; display: flex; align-items: center;">
-                <span style="position: absolute; left: 12.5%; transform: translateX(-50%); font-size: 0.7rem; font-weight: 700; color: white; text-shadow: 1px 1px 2px rgba(0,0,0,0.7);">LOW</span>
-                <span style="position: absolute; left: 35%; transform: translateX(-50%); font-size: 0.7rem; font-weight: 700; color: white; text-shadow: 1px 1px 2px rgba(0,0,0,0.7);">MEDIUM</span>
-                <span style="position: absolute; left: 57.5%; transform: translateX(-50%); font-size: 0.7rem; font-weight: 700; color: white; text-shadow: 1px 1px 2px rgba(0,0,0,0.7);">HIGH</span>
-                <span style="position: absolute; left: 85%; transform: translateX(-50%); font-size: 0.7rem; font-weight: 700; color: white; text-shadow: 1px 1px 2px rgba(0,0,0,0.7);">VERY HIGH</span>
+{labels}
             </div>
             <!-- Patient risk indicator -->
             <div style="position: absolute; left: {risk_score}%; top: 50%; transform: translate(-50%, -50%); width: 26px; height: 26px; background-color: white; border: 4px solid #2c3e50; border-radius: 50%; box-shadow: 0 0 20px rgba(0,0,0,0.7); z-index: 100;"></div>
@@ -441,6 +510,22 @@ if calc_btn:
         Patient's estimated one-year mortality risk is <strong>{risk_score:.1f}%</strong> ({category}).
     </div>
     """, unsafe_allow_html=True)
+    metrics.observe("render", time.perf_counter() - render_start)
+    
+    # Risk contributors: features pushing this patient above the reference patient
+    if result["contributors"]:
+        items = ""
+        for feature_name, contribution in result["contributors"]:
+            spec = FEATURE_REGISTRY[feature_name]
+            value = spec.display(inputs[feature_name])
+            label = spec.short_label
+            items += f'<div class="contributor-item">{label}: <strong>{value}</strong> (+{contribution * 100:.1f} points)</div>'
+        st.markdown(f"""
+        <div class="contributors-box">
+            <div class="contributors-title">⚠️ KEY RISK CONTRIBUTORS</div>
+            {items}
+        </div>
+        """, unsafe_allow_html=True)
     
     # Details expander
     with st.expander("📊 Model Details & Interpretation"):
@@ -466,6 +551,48 @@ if calc_btn:
             f"- 🔴 **VERY HIGH:** ≥ {thresholds['high']*100:.0f}%"
         )
         
+        st.markdown("**All Models in the Bundle:**")
+        st.markdown("  \n".join(
+            f"- `{name}`: {p[0]*100:.1f}% ({get_risk_category(p[0], thresholds)[0]})"
+            + (" — reported model" if name == "calibrated_svm" else "")
+            for name, p in result["comparison"].items()
+        ))
+    
+    # Sensitivity curves, computed with the result
+    with st.expander("📈 Sensitivity: how risk changes with each input"):
+        st.caption(
+            "Each curve varies one input across its full range while all other inputs stay at "
+            "this patient's values. Dashed lines mark the risk category boundaries; the dot is "
+            "the current patient."
+        )
+        curves = result["curves"]
+        spec = sensitivity_spec(tuple(FEATURE_LABELS[name] for name in curves),
+                                tuple(thresholds[k] * 100 for k in ("low", "medium", "high")))
+        st.vega_lite_chart(sensitivity_data(curves, inputs, risk_score), spec)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CALCULATOR FRAGMENT
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@st.fragment
+def calculator():
+    """Inputs and results. A widget change reruns only this fragment, not the static page around it."""
+    fragment_start = time.perf_counter()
+    # One snapshot per run, so a reload never mixes model versions within the results
+    models = load_registry().current
+    inputs = patient_inputs()
+    
+    if st.button("🔬 CALCULATE RISK SCORE"):
+        st.session_state.result = compute_results(models, inputs)
+    # Later widget changes redraw the stored result without rescoring it
+    if "result" in st.session_state:
+        show_results(st.session_state.result, inputs)
+    metrics.observe("fragment_rerun", time.perf_counter() - fragment_start)
+
+
+calculator()
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # DISCLAIMER
@@ -494,49 +621,13 @@ st.markdown("""
 # ═══════════════════════════════════════════════════════════════════════════════
 
 with st.sidebar:
-    st.markdown("### ℹ️ MODEL INFORMATION")
-    
-    st.markdown("**ALGORITHM SPECIFICATIONS:**")
-    st.markdown("• Model: Support Vector Machine (RBF kernel)")
-    st.markdown("• Calibration: Platt scaling (sigmoid)")
-    st.markdown("• Feature Selection: 16 clinical variables")
-    
-    st.markdown("**STUDY POPULATION:**")
-    st.markdown("• Training Cohort: n=476 (Tongji Hospital, Wuhan, China)")
-    st.markdown("• Validation Cohort: n=354 (MIMIC-IV, Boston, USA)")
-    st.markdown("• Inclusion: AMI patients undergoing IABP")
-    st.markdown("• Follow-up: 12 months")
-    
-    st.markdown("**PERFORMANCE METRICS:**")
-    if 'performance' in bundle and 'phase_b' in bundle['performance']:
-        perf = bundle['performance']['phase_b']['external_confirmatory']
-        st.markdown(f"• External AUC: {perf['auc']:.3f}")
-        st.markdown(f"• Brier Score: {perf['brier']:.3f}")
-        if 'calibration' in perf:
-            st.markdown(f"• Calibration Slope: {perf['calibration']['slope']:.3f}")
-    
-    st.markdown("**RISK STRATIFICATION:**")
-    st.markdown("• Thresholds: 25%, 45%, 70%")
-    st.markdown("• Trend test: p < 0.001")
-    
-    st.markdown("---")
-    
-    st.markdown("### 📄 CITATION INFORMATION")
-    st.markdown("""
-    Z. S. Zampawala, et al. (2025). External Validation of a Machine Learning Model for One-Year Mortality 
-    in IABP-Treated Acute Myocardial Infarction: The PULSE-IABP Risk Score
-    [Journal Name]. [In Press].
-    
-    DOI: [To be assigned]
-    
-    © 2025 Z. S. Zampawala et al. All rights reserved.
-    """)
-
-
-
-
-
-
+    st.markdown(sidebar_markdown(models.fingerprint, models.bundle))
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# METRICS
+# ═══════════════════════════════════════════════════════════════════════════════
 
+# Full-page runs only; widget changes are recorded as fragment_rerun
+metrics.observe("rerun", time.perf_counter() - rerun_start)
+metrics.maybe_write()
@@ -0,0 +1,250 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP COHORT REPORT
+# Risk stratification of a whole cohort, accumulated batch by batch
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Usage:
+#   python pulse_iabp_cohort.py scored.csv
+#   python pulse_iabp_cohort.py cohort.parquet --outcome died_1y --out report.json
+#   python pulse_iabp_cohort.py week_47.csv --outcome died_1y --state cohort_state.json
+#
+# CohortReport.update() puts a batch of probabilities into the bundle's risk
+# categories with one searchsorted pass and folds per-category totals into fixed-size
+# running state (patients, summed predicted risk and, where the outcome is known,
+# patients and deaths). report() then gives each category's share, mean predicted
+# and observed mortality, and the Cochran-Armitage trend test across categories,
+# at any time and without rescanning earlier batches. Reports from separate runs
+# combine with merge(), or through --state, which loads the running state, adds
+# the new files and saves it again.
+#
+# Inputs that already have a "probability" column (pulse_iabp_batch.py output)
+# are not rescored; otherwise the model features are scored here. Rows with
+# missing features or probability are counted as unscored. The reference is the
+# training cohort in risk_thresholds.validation_results.training.
+
+import argparse
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+from pulse_iabp_artifact import ARTIFACT_PATH, THRESHOLD_KEYS, load_predictor
+from pulse_iabp_batch import iter_cohort
+from pulse_iabp_model import (
+    BUNDLE_PATH, RISK_CATEGORIES, cochran_armitage, risk_category_index, training_category_counts,
+)
+
+TREND_ALPHA = 0.05
+
+
+class CohortReport:
+    """Running per-category counts, predicted risk and outcomes of a scored cohort."""
+
+    def __init__(self, thresholds, reference=None):
+        self.thresholds = {key: float(thresholds[key]) for key in THRESHOLD_KEYS}
+        # (patients, deaths) per category in the training cohort
+        self.reference = reference
+        self.reset()
+
+    @classmethod
+    def from_bundle(cls, bundle):
+        return cls(bundle["risk_thresholds"], training_category_counts(bundle))
+
+    def reset(self):
+        k = len(RISK_CATEGORIES)
+        self.unscored = 0
+        self.counts = np.zeros(k, dtype=np.int64)
+        self.predicted = np.zeros(k)
+        self.with_outcome = np.zeros(k, dtype=np.int64)
+        self.deaths = np.zeros(k, dtype=np.int64)
+
+    def update(self, probs, outcomes=None):
+        """Fold one batch of P(death), and optionally 0/1 outcomes (NaN = unknown), into the totals."""
+        probs = np.asarray(probs, dtype=float).ravel()
+        category = risk_category_index(probs, self.thresholds)
+        scored = category >= 0
+        k = len(RISK_CATEGORIES)
+        category = category[scored]
+        self.unscored += int(len(probs) - scored.sum())
+        self.counts += np.bincount(category, minlength=k)
+        self.predicted += np.bincount(category, weights=probs[scored], minlength=k)
+        if outcomes is None:
+            return
+        outcomes = np.asarray(outcomes, dtype=float).ravel()[scored]
+        known = ~np.isnan(outcomes)
+        if not np.isin(outcomes[known], (0, 1)).all():
+            raise ValueError("outcomes must be coded 0/1")
+        self.with_outcome += np.bincount(category[known], minlength=k)
+        self.deaths += np.bincount(category[known], weights=outcomes[known], minlength=k).astype(np.int64)
+
+    def merge(self, other):
+        """Add the totals of another report with the same thresholds."""
+        if other.thresholds != self.thresholds:
+            raise ValueError("cannot merge cohort reports with different risk thresholds")
+        self.unscored += other.unscored
+        self.counts += other.counts
+        self.predicted += other.predicted
+        self.with_outcome += other.with_outcome
+        self.deaths += other.deaths
+        return self
+
+    # ─── report ──────────────────────────────────────────────────────────────
+
+    def report(self):
+        """Current stratification as a JSON-ready dict."""
+        n = int(self.counts.sum())
+        n_outcome = int(self.with_outcome.sum())
+        report = {
+            "n": n, "unscored": self.unscored, "n_with_outcome": n_outcome, "deaths": int(self.deaths.sum()),
+            "thresholds": dict(self.thresholds), "categories": {}, "trend_test": None,
+        }
+        bounds = [0.0, *(self.thresholds[key] for key in THRESHOLD_KEYS), 1.0]
+        if self.reference is not None:
+            training_n, training_deaths = self.reference
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shares = self.counts / n
+            mean_predicted = self.predicted / self.counts
+            observed = self.deaths / self.with_outcome
+        for k, (label, _, _) in enumerate(RISK_CATEGORIES):
+            entry = {
+                "range": [bounds[k], bounds[k + 1]],
+                "count": int(self.counts[k]),
+                "share": _number(shares[k]),
+                "mean_predicted": _number(mean_predicted[k]),
+            }
+            if n_outcome:
+                entry["n_with_outcome"] = int(self.with_outcome[k])
+                entry["deaths"] = int(self.deaths[k])
+                entry["observed_mortality"] = _number(observed[k])
+            if self.reference is not None:
+                entry["training_share"] = float(training_n[k] / training_n.sum())
+                entry["training_mortality"] = _number(training_deaths[k] / training_n[k])
+            report["categories"][label] = entry
+        if n_outcome:
+            z, p = cochran_armitage(self.with_outcome, self.deaths)
+            report["trend_test"] = {
+                "z_statistic": _number(z), "p_value": _number(p),
+                "significant": bool(p < TREND_ALPHA),
+            }
+        return report
+
+    # ─── persistence ─────────────────────────────────────────────────────────
+
+    def state(self):
+        """Running totals as plain lists, e.g. to continue the report in a later run."""
+        return {
+            "thresholds": self.thresholds, "unscored": self.unscored, "counts": self.counts.tolist(),
+            "predicted": self.predicted.tolist(), "with_outcome": self.with_outcome.tolist(),
+            "deaths": self.deaths.tolist(),
+        }
+
+    def restore(self, state):
+        """Continue from a state() recorded with the same thresholds."""
+        if state["thresholds"] != self.thresholds:
+            raise ValueError("cohort state was recorded with different risk thresholds")
+        self.unscored = int(state["unscored"])
+        self.counts = np.array(state["counts"], dtype=np.int64)
+        self.predicted = np.array(state["predicted"], dtype=float)
+        self.with_outcome = np.array(state["with_outcome"], dtype=np.int64)
+        self.deaths = np.array(state["deaths"], dtype=np.int64)
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state(), f)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """Restore from ``path`` if it exists; returns True if state was loaded."""
+        if not os.path.exists(path):
+            return False
+        with open(path, encoding="utf-8") as f:
+            self.restore(json.load(f))
+        return True
+
+
+def _number(value):
+    # JSON has no NaN; empty categories and undefined statistics are null
+    return None if math.isnan(value) else float(value)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMMAND LINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def add_cohort(report, path, model, features, outcome=None):
+    """Fold every chunk of ``path`` into ``report``; returns the number of rows read."""
+    rows = 0
+    for chunk in iter_cohort(path):
+        if outcome is not None and outcome not in chunk.columns:
+            raise ValueError(f"{path} has no {outcome} column")
+        if "probability" in chunk.columns:
+            probs = chunk["probability"].to_numpy(dtype=float)
+        else:
+            missing = [f for f in features if f not in chunk.columns]
+            if missing:
+                raise ValueError(f"{path} has neither a probability column nor the features "
+                                 f"{', '.join(missing)}")
+            X = chunk[features].to_numpy(dtype=float)
+            complete = ~np.isnan(X).any(axis=1)
+            probs = np.full(len(chunk), np.nan)
+            if complete.any():
+                probs[complete] = model.predict_proba(X[complete])[:, 1]
+        report.update(probs, None if outcome is None else chunk[outcome].to_numpy(dtype=float))
+        rows += len(chunk)
+    return rows
+
+
+def _percent(value):
+    return "" if value is None else f"{value:.1%}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Risk-stratification report for a PULSE-IABP cohort.")
+    parser.add_argument("inputs", nargs="+", help="cohort CSV or Parquet files, scored or with the model features")
+    parser.add_argument("--outcome", help="0/1 outcome column (1 = died) for observed mortality and the trend test")
+    parser.add_argument("--state", help="running totals to continue from and update (JSON)")
+    parser.add_argument("--out", help="write the report as JSON")
+    parser.add_argument("--bundle", default=BUNDLE_PATH, help="model bundle (default: %(default)s)")
+    parser.add_argument("--artifact", default=ARTIFACT_PATH, help="native artifact (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    bundle, model = load_predictor(args.bundle, args.artifact)
+    cohort = CohortReport.from_bundle(bundle)
+    try:
+        if args.state:
+            cohort.load(args.state)
+        for path in args.inputs:
+            add_cohort(cohort, path, model, bundle["model_info"]["features"], args.outcome)
+    except ValueError as e:
+        parser.exit(2, f"error: {e}\n")
+    if args.state:
+        cohort.save(args.state)
+
+    report = cohort.report()
+    print(f"{report['n']:,} patients"
+          + (f", {report['deaths']:,} deaths in {report['n_with_outcome']:,} with outcome" if args.outcome else "")
+          + (f" ({report['unscored']:,} unscored rows)" if report["unscored"] else ""))
+    print(f"{'category':<16}{'range':>10}{'patients':>10}{'share':>8}{'predicted':>11}{'observed':>10}"
+          f"{'training':>10}")
+    for label, entry in report["categories"].items():
+        low, high = entry["range"]
+        print(f"{label:<16}{f'{low:.0%}-{high:.0%}':>10}{entry['count']:>10,}{_percent(entry['share']):>8}"
+              f"{_percent(entry['mean_predicted']):>11}{_percent(entry.get('observed_mortality')):>10}"
+              f"{_percent(entry.get('training_mortality')):>10}")
+    trend = report["trend_test"]
+    if trend is not None and trend["z_statistic"] is not None:
+        p = trend["p_value"]
+        print(f"Cochran-Armitage trend: z = {trend['z_statistic']:.2f}, "
+              + ("p < 0.001" if p < 0.001 else f"p = {p:.3f}"))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
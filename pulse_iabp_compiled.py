@@ -0,0 +1,294 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP COMPILED PREDICTOR
+# Fused NumPy evaluation of the calibrated RBF-SVM ensemble
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# bundle["models"]["calibrated_svm"] averages five StandardScaler + SVC pipelines,
+# each followed by Platt (sigmoid) calibration. CompiledSVM stacks every fold's
+# support vectors, dual coefficients, intercepts, scaler statistics and Platt
+# parameters into contiguous arrays so that all folds are evaluated with a single
+# kernel product, without sklearn or per-fold Python overhead.
+#
+# CompiledSVC covers a single probability=True SVC on StandardScaler-ed inputs
+# (bundle["models"]["base_svm"]), and CompiledSVM.stack() joins several compiled
+# models so that all of them are evaluated by one kernel product.
+#
+# Self-check against sklearn:
+#   python pulse_iabp_compiled.py
+
+import sys
+import time
+
+import numpy as np
+
+from pulse_iabp_metrics import metrics
+
+# Largest |compiled - sklearn| probability accepted when compiling a bundle
+DEFAULT_TOLERANCE = 1e-9
+
+# Rows evaluated per kernel block; bounds memory at ~rows × n_support × 8 bytes
+BLOCK_ROWS = 256
+
+
+def _expit(t):
+    return 0.5 * (1.0 + np.tanh(0.5 * t))
+
+
+class CompiledSVM:
+    """Drop-in replacement for CalibratedClassifierCV.predict_proba on binary RBF-SVMs.
+
+    Arrays (m support vectors in total, F folds, d features):
+        support_vectors (m, d)  scaled support vectors of every fold
+        fold_index      (m,)    fold each support vector belongs to
+        dual_coef       (m,)    signed dual coefficients
+        intercept       (F,)    SVC intercepts
+        gamma           (F,)    RBF kernel widths
+        mean, scale     (F, d)  StandardScaler statistics
+        platt_a, platt_b (F,)   sigmoid calibration parameters
+    """
+
+    ARRAY_NAMES = (
+        "support_vectors", "fold_index", "dual_coef", "intercept", "gamma",
+        "mean", "scale", "platt_a", "platt_b",
+    )
+
+    def __init__(self, support_vectors, fold_index, dual_coef, intercept, gamma,
+                 mean, scale, platt_a, platt_b):
+        self.support_vectors = np.asarray(support_vectors, dtype=float)
+        self.fold_index = np.asarray(fold_index, dtype=np.intp)
+        self.dual_coef = np.asarray(dual_coef, dtype=float)
+        self.intercept = np.asarray(intercept, dtype=float)
+        self.gamma = np.asarray(gamma, dtype=float)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.platt_a = np.asarray(platt_a, dtype=float)
+        self.platt_b = np.asarray(platt_b, dtype=float)
+
+        self.n_folds, self.n_features_in_ = self.mean.shape
+        self.classes_ = np.array([0, 1])
+
+        # Support vectors are kept grouped by fold so each fold is a column slice
+        order = np.argsort(self.fold_index, kind="stable")
+        fold = self.fold_index[order]
+        sv = self.support_vectors[order]
+        bounds = np.searchsorted(fold, np.arange(self.n_folds + 1))
+        self._fold_slices = [slice(bounds[k], bounds[k + 1]) for k in range(self.n_folds)]
+
+        # -γ‖z_k - v‖² = 2γ x·(v/s_k) - 2γ(μ_k/s_k)·v - γ‖v‖² - γ‖z_k‖², so the
+        # per-fold scaling folds into the support vectors and every fold's kernel
+        # argument comes from one raw-space product plus a per-(row, fold) term
+        sv_gamma = self.gamma[fold][:, None]
+        self._sv_weights = np.ascontiguousarray((2.0 * sv_gamma * sv / self.scale[fold]).T)
+        self._sv_offset = -sv_gamma[:, 0] * (
+            2.0 * np.einsum("ij,ij->i", self.mean[fold] / self.scale[fold], sv)
+            + np.einsum("ij,ij->i", sv, sv)
+        )
+        # (m, F) block matrix summing each fold's weighted kernel column
+        self._dual_blocks = np.zeros((len(fold), self.n_folds))
+        self._dual_blocks[np.arange(len(fold)), fold] = self.dual_coef[order]
+
+    # ─── construction ────────────────────────────────────────────────────────
+
+    @classmethod
+    def from_calibrated(cls, model):
+        """Extract the fused arrays from a fitted CalibratedClassifierCV."""
+        svs, folds, duals, intercepts, gammas = [], [], [], [], []
+        means, scales, platt_a, platt_b = [], [], [], []
+        for k, calibrated in enumerate(model.calibrated_classifiers_):
+            scaler, svc = calibrated.estimator.steps[0][1], calibrated.estimator.steps[-1][1]
+            if len(calibrated.calibrators) != 1 or svc.kernel != "rbf":
+                raise ValueError("Only binary RBF-SVM pipelines with sigmoid calibration can be compiled")
+            calibrator = calibrated.calibrators[0]
+            svs.append(svc.support_vectors_)
+            folds.append(np.full(len(svc.support_vectors_), k))
+            duals.append(svc.dual_coef_[0])
+            intercepts.append(svc.intercept_[0])
+            gammas.append(svc._gamma)
+            means.append(scaler.mean_)
+            scales.append(scaler.scale_)
+            platt_a.append(calibrator.a_)
+            platt_b.append(calibrator.b_)
+        return cls(
+            np.vstack(svs), np.concatenate(folds), np.concatenate(duals), intercepts, gammas,
+            np.vstack(means), np.vstack(scales), platt_a, platt_b,
+        )
+
+    @classmethod
+    def from_bundle(cls, bundle, tolerance=DEFAULT_TOLERANCE):
+        """Compile bundle["models"]["calibrated_svm"] and verify it against sklearn."""
+        model = bundle["models"]["calibrated_svm"]
+        compiled = cls.from_calibrated(model)
+        error = max_abs_error(compiled, model, compiled.reference_sample())
+        if error > tolerance:
+            raise ValueError(f"Compiled predictor deviates from sklearn by {error:.3g} (> {tolerance:g})")
+        return compiled
+
+    def arrays(self):
+        """The arrays needed to rebuild this predictor, keyed by constructor argument."""
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    def reference_sample(self):
+        """Every fold's support vectors mapped back to raw (unscaled) feature space."""
+        fold = self.fold_index
+        return self.support_vectors * self.scale[fold] + self.mean[fold]
+
+    # ─── prediction ──────────────────────────────────────────────────────────
+
+    def _block_decision(self, X):
+        with metrics.stage("scaling"):
+            Z = (X[:, None, :] - self.mean[None]) / self.scale[None]
+            row_terms = self.gamma * np.einsum("nfd,nfd->nf", Z, Z)
+        with metrics.stage("kernel"):
+            arg = X @ self._sv_weights
+            arg += self._sv_offset
+            for k, cols in enumerate(self._fold_slices):
+                arg[:, cols] -= row_terms[:, k:k + 1]
+            np.minimum(arg, 0.0, out=arg)
+            np.exp(arg, out=arg)
+            return arg @ self._dual_blocks + self.intercept
+
+    def decision_function(self, X):
+        """Per-fold SVC decision values, shape (n, n_folds)."""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected {self.n_features_in_} features, got {X.shape[1]}")
+        if len(X) <= BLOCK_ROWS:
+            return self._block_decision(X)
+        return np.vstack([self._block_decision(X[i:i + BLOCK_ROWS]) for i in range(0, len(X), BLOCK_ROWS)])
+
+    def fold_probabilities(self, X):
+        """Platt-calibrated P(death) of every fold, shape (n, n_folds)."""
+        decision = self.decision_function(X)
+        with metrics.stage("calibration"):
+            return _expit(-(self.platt_a * decision + self.platt_b))
+
+    def combine_folds(self, fold_probs):
+        """P(death) from this model's fold probabilities: their average."""
+        return fold_probs.mean(axis=1)
+
+    def predict_proba(self, X):
+        """Fold-averaged Platt-calibrated probabilities, shape (n, 2)."""
+        p1 = self.combine_folds(self.fold_probabilities(X))
+        return np.column_stack([1.0 - p1, p1])
+
+    @classmethod
+    def stack(cls, models):
+        """One CompiledSVM holding every fold of ``models``, and each model's fold slice."""
+        arrays = [model.arrays() for model in models]
+        fold_offsets = np.cumsum([0] + [model.n_folds for model in models])
+        stacked = CompiledSVM(
+            np.vstack([a["support_vectors"] for a in arrays]),
+            np.concatenate([a["fold_index"] + offset for a, offset in zip(arrays, fold_offsets)]),
+            *(np.concatenate([np.atleast_1d(a[name]) for a in arrays]) for name in ("dual_coef", "intercept", "gamma")),
+            *(np.vstack([a[name] for a in arrays]) for name in ("mean", "scale")),
+            *(np.concatenate([np.atleast_1d(a[name]) for a in arrays]) for name in ("platt_a", "platt_b")),
+        )
+        slices = [slice(fold_offsets[i], fold_offsets[i + 1]) for i in range(len(models))]
+        return stacked, slices
+
+
+def libsvm_coupling(p1):
+    """P(class 0), P(class 1) from a pairwise probability, exactly as sklearn's libsvm.
+
+    libsvm runs its iterative multi-class coupling even for two classes and stops
+    once the residual is below 0.0025, so SVC.predict_proba differs from the plain
+    sigmoid by up to a few thousandths. This repeats the same iterations per row.
+    """
+    r01 = np.clip(1.0 - np.asarray(p1, dtype=float), 1e-7, 1 - 1e-7)
+    r10 = 1.0 - r01
+    q00, q11, q01 = r10 * r10, r01 * r01, -r10 * r01
+    p = [np.full_like(r01, 0.5), np.full_like(r01, 0.5)]
+    q = ((q00, q01), (q01, q11))
+    active = np.ones(r01.shape, dtype=bool)
+    for _ in range(100):
+        qp = [q00 * p[0] + q01 * p[1], q01 * p[0] + q11 * p[1]]
+        pqp = p[0] * qp[0] + p[1] * qp[1]
+        active &= np.maximum(np.abs(qp[0] - pqp), np.abs(qp[1] - pqp)) >= 0.0025
+        if not active.any():
+            break
+        for t in (0, 1):
+            diff = np.where(active, (pqp - qp[t]) / q[t][t], 0.0)
+            p[t] = p[t] + diff
+            pqp = (pqp + diff * (diff * q[t][t] + 2.0 * qp[t])) / (1.0 + diff) ** 2
+            qp = [(qp[j] + diff * q[t][j]) / (1.0 + diff) for j in (0, 1)]
+            p = [p[j] / (1.0 + diff) for j in (0, 1)]
+    return p[0], p[1]
+
+
+class CompiledSVC(CompiledSVM):
+    """A single probability=True SVC preceded by a StandardScaler, as one fold."""
+
+    @classmethod
+    def from_svc(cls, svc, scaler):
+        if svc.kernel != "rbf" or len(svc.classes_) != 2 or not svc.probability:
+            raise ValueError("Only binary RBF SVCs with probability=True can be compiled")
+        # libsvm's sigmoid 1 / (1 + exp(A·dec + B)) acts on dec = -decision_function
+        return cls(
+            svc.support_vectors_, np.zeros(len(svc.support_vectors_), dtype=np.intp), svc.dual_coef_[0],
+            svc.intercept_, [svc._gamma], scaler.mean_[None], scaler.scale_[None], svc.probA_, -svc.probB_,
+        )
+
+    def combine_folds(self, fold_probs):
+        return libsvm_coupling(fold_probs[:, 0])[1]
+
+
+def compile_models(bundle, tolerance=DEFAULT_TOLERANCE):
+    """{name: compiled model} for every scoring model in bundle["models"], each verified against sklearn."""
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.svm import SVC
+
+    models = bundle["models"]
+    compiled = {}
+    for name, model in models.items():
+        if isinstance(model, CalibratedClassifierCV):
+            compiled[name] = CompiledSVM.from_calibrated(model)
+            X = compiled[name].reference_sample()
+            reference = model.predict_proba(X)[:, 1]
+        elif isinstance(model, SVC) and model.probability and "scaler" in models:
+            scaler = models["scaler"]
+            compiled[name] = CompiledSVC.from_svc(model, scaler)
+            X = compiled[name].reference_sample()
+            reference = model.predict_proba((X - scaler.mean_) / scaler.scale_)[:, 1]
+        else:
+            continue
+        error = float(np.max(np.abs(compiled[name].predict_proba(X)[:, 1] - reference)))
+        if error > tolerance:
+            raise ValueError(f"Compiled {name} deviates from sklearn by {error:.3g} (> {tolerance:g})")
+    return compiled
+
+
+def max_abs_error(compiled, model, X):
+    """Largest absolute difference in P(death) between compiled and sklearn predictions."""
+    return float(np.max(np.abs(compiled.predict_proba(X)[:, 1] - model.predict_proba(X)[:, 1])))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SELF-CHECK
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _per_row_seconds(predict, X, repeats=200):
+    start = time.perf_counter()
+    for i in range(repeats):
+        predict(X[i % len(X):i % len(X) + 1])
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    from pulse_iabp_model import load_bundle
+
+    bundle = load_bundle()
+    model = bundle["models"]["calibrated_svm"]
+    compiled = CompiledSVM.from_calibrated(model)
+    X = compiled.reference_sample()
+
+    error = max_abs_error(compiled, model, X)
+    sklearn_s = _per_row_seconds(model.predict_proba, X)
+    compiled_s = _per_row_seconds(compiled.predict_proba, X)
+    print(f"Reference rows: {len(X)}, max |Δp| = {error:.3g} (tolerance {DEFAULT_TOLERANCE:g})")
+    print(f"Single-row latency: sklearn {sklearn_s * 1e3:.3f} ms, compiled {compiled_s * 1e3:.3f} ms "
+          f"({sklearn_s / compiled_s:.1f}×)")
+    return 0 if error <= DEFAULT_TOLERANCE else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
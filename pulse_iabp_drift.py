@@ -0,0 +1,255 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP DRIFT MONITOR
+# Running input and risk-mix statistics compared with the training cohort
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# DriftMonitor.update() folds each scored batch into fixed-size running state:
+#
+#   per feature   count, mean and M2 (Welford / Chan's parallel update) and a
+#                 histogram over fixed bins of the training z-score
+#   per category  number of patients scored in each risk category
+#
+# so memory is O(features × bins) whatever the volume, and report() is available
+# at any time without rescanning past requests. The reference is the training
+# cohort as stored in the bundle: the StandardScaler's mean_/scale_ for inputs
+# (binary features: mean_ is the training prevalence), the same z-score histogram
+# of the training patients the primary model keeps as support vectors (with
+# C = 0.1, most of the cohort) and the training category shares in
+# risk_thresholds.validation_results.training.
+#
+# The report gives, per feature, the standardized mean shift (observed mean minus
+# training mean, in training SDs), the SD ratio and a population stability index
+# (PSI) against the training histogram (Bernoulli with the training prevalence for
+# binary features), and per category the observed share against training. Lactate,
+# glucose and the other skewed labs are far from normal, so the reference bins are
+# empirical; without a training sample no PSI is computed for continuous features.
+# Features with |shift| >= DRIFT_SHIFT_SD or PSI >= DRIFT_PSI, and categories whose
+# share moved by DRIFT_CATEGORY_CHANGE or more, are listed under "flags" once at
+# least MIN_RECORDS patients have been seen.
+
+import json
+import os
+import threading
+
+import numpy as np
+
+from pulse_iabp_artifact import ARTIFACT_PATH, PRIMARY_MODEL, load_arrays
+from pulse_iabp_compiled import CompiledSVM
+from pulse_iabp_model import FEATURE_REGISTRY, RISK_CATEGORIES, risk_cutoffs, training_category_counts
+from pulse_iabp_validation import training_statistics
+
+# Histogram bin edges in training SDs; the outer bins collect everything beyond ±4
+Z_EDGES = np.arange(-4.0, 4.01, 0.5)
+
+DRIFT_SHIFT_SD = 0.5
+DRIFT_PSI = 0.25
+DRIFT_CATEGORY_CHANGE = 0.10
+MIN_RECORDS = 100
+
+# Small share substituted for empty bins so PSI stays finite
+_PSI_FLOOR = 1e-4
+
+
+def training_category_shares(bundle):
+    """Training share of each risk category (same order as RISK_CATEGORIES), or None."""
+    counts = training_category_counts(bundle)
+    return None if counts is None else counts[0] / counts[0].sum()
+
+
+def training_sample(bundle, artifact_path=ARTIFACT_PATH):
+    """Distinct training patients kept as support vectors by the primary model, in raw feature space."""
+    if "models" in bundle:
+        compiled = CompiledSVM.from_calibrated(bundle["models"][PRIMARY_MODEL])
+    else:
+        arrays = load_arrays(artifact_path, bundle)
+        compiled = CompiledSVM(**{name: arrays[name] for name in CompiledSVM.ARRAY_NAMES})
+    return np.unique(compiled.reference_sample(), axis=0)
+
+
+def _bin_index(X, mean, scale, edges):
+    return np.searchsorted(edges, (X - mean) / scale, side="right")
+
+
+def _bin_counts(bins, n_bins):
+    flat = (bins + np.arange(bins.shape[1]) * n_bins).ravel()
+    return np.bincount(flat, minlength=bins.shape[1] * n_bins).reshape(bins.shape[1], n_bins)
+
+
+def _same_reference(a, b):
+    """True if two reference dicts (see DriftMonitor.reference()) hold the same values."""
+    if list(a["features"]) != list(b["features"]):
+        return False
+    for key in ("edges", "mean", "scale", "cutoffs", "training_shares", "bin_shares"):
+        x, y = a[key], b[key]
+        if x is None or y is None:
+            if x is not None or y is not None:
+                return False
+        elif np.shape(x) != np.shape(y) or not np.allclose(x, y):
+            return False
+    return True
+
+
+def _psi(observed, expected):
+    observed = np.maximum(observed, _PSI_FLOOR)
+    expected = np.maximum(expected, _PSI_FLOOR)
+    return float(((observed - expected) * np.log(observed / expected)).sum())
+
+
+class DriftMonitor:
+    """Running per-feature moments, z-score histograms and risk category counts."""
+
+    def __init__(self, features, mean, scale, thresholds, training_shares=None, reference_sample=None,
+                 edges=Z_EDGES):
+        self.features = list(features)
+        self.train_mean = np.asarray(mean, dtype=float)
+        self.train_scale = np.asarray(scale, dtype=float)
+        self.cutoffs = risk_cutoffs(thresholds)
+        self.training_shares = None if training_shares is None else np.asarray(training_shares, dtype=float)
+        self.edges = np.asarray(edges, dtype=float)
+        self.binary = np.array([FEATURE_REGISTRY[f].is_binary for f in self.features])
+        # (features, bins) shares of the training sample; None = no PSI for continuous features
+        self.bin_shares = None
+        if reference_sample is not None:
+            sample = np.atleast_2d(np.asarray(reference_sample, dtype=float))
+            bins = _bin_index(sample, self.train_mean, self.train_scale, self.edges)
+            self.bin_shares = _bin_counts(bins, len(self.edges) + 1) / len(sample)
+        self._lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_bundle(cls, bundle, artifact_path=ARTIFACT_PATH, **kwargs):
+        mean, scale = training_statistics(bundle, artifact_path)
+        return cls(bundle["model_info"]["features"], mean, scale, bundle["risk_thresholds"],
+                   training_category_shares(bundle), training_sample(bundle, artifact_path), **kwargs)
+
+    def reference(self):
+        """Everything the statistics are compared against, as a JSON-ready dict."""
+        def plain(array):
+            return None if array is None else array.tolist()
+        return {
+            "features": self.features, "edges": plain(self.edges), "mean": plain(self.train_mean),
+            "scale": plain(self.train_scale), "cutoffs": plain(self.cutoffs),
+            "training_shares": plain(self.training_shares), "bin_shares": plain(self.bin_shares),
+        }
+
+    def same_reference(self, other):
+        """True if ``other`` compares against the same training reference and bins."""
+        return _same_reference(self.reference(), other.reference())
+
+    def reset(self):
+        d = len(self.features)
+        self.n = 0
+        self.mean = np.zeros(d)
+        self.m2 = np.zeros(d)
+        self.histogram = np.zeros((d, len(self.edges) + 1), dtype=np.int64)
+        self.category_counts = np.zeros(len(RISK_CATEGORIES), dtype=np.int64)
+
+    def update(self, X, probs):
+        """Fold one scored batch of raw inputs and P(death) into the running state."""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        probs = np.asarray(probs, dtype=float).ravel()
+        n_b = len(X)
+        if n_b == 0:
+            return
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+        bins = _bin_index(X, self.train_mean, self.train_scale, self.edges)
+        histogram_b = _bin_counts(bins, self.histogram.shape[1])
+        categories_b = np.bincount(np.searchsorted(self.cutoffs, probs, side="right"),
+                                   minlength=len(RISK_CATEGORIES))
+
+        with self._lock:
+            n_a = self.n
+            n = n_a + n_b
+            delta = mean_b - self.mean
+            self.mean = self.mean + delta * (n_b / n)
+            self.m2 = self.m2 + m2_b + delta ** 2 * (n_a * n_b / n)
+            self.n = n
+            self.histogram += histogram_b
+            self.category_counts += categories_b
+
+    # ─── report ──────────────────────────────────────────────────────────────
+
+    def report(self):
+        """Current drift summary as a JSON-ready dict."""
+        with self._lock:
+            n, mean, m2 = self.n, self.mean.copy(), self.m2.copy()
+            histogram, category_counts = self.histogram.copy(), self.category_counts.copy()
+
+        report = {"n": n, "features": {}, "categories": {}, "flags": []}
+        if n == 0:
+            return report
+        sd = np.sqrt(m2 / (n - 1)) if n > 1 else np.full(len(mean), np.nan)
+        shift = (mean - self.train_mean) / self.train_scale
+        enough = n >= MIN_RECORDS
+
+        for j, feature in enumerate(self.features):
+            if self.binary[j]:
+                p_train = self.train_mean[j]
+                psi = _psi(np.array([1 - mean[j], mean[j]]), np.array([1 - p_train, p_train]))
+            elif self.bin_shares is not None:
+                psi = _psi(histogram[j] / n, self.bin_shares[j])
+            else:
+                psi = None
+            report["features"][feature] = {
+                "mean": float(mean[j]),
+                "sd": float(sd[j]),
+                "training_mean": float(self.train_mean[j]),
+                "training_sd": float(self.train_scale[j]),
+                "shift_sd": float(shift[j]),
+                "sd_ratio": float(sd[j] / self.train_scale[j]),
+                "psi": psi,
+            }
+            if enough and (abs(shift[j]) >= DRIFT_SHIFT_SD or (psi is not None and psi >= DRIFT_PSI)):
+                report["flags"].append(f"{feature}: mean shifted {shift[j]:+.2f} SD"
+                                       + ("" if psi is None else f", PSI {psi:.2f}"))
+
+        shares = category_counts / n
+        for k, (label, _, _) in enumerate(RISK_CATEGORIES):
+            entry = {"count": int(category_counts[k]), "share": float(shares[k])}
+            if self.training_shares is not None:
+                entry["training_share"] = float(self.training_shares[k])
+                entry["change"] = float(shares[k] - self.training_shares[k])
+                if enough and abs(entry["change"]) >= DRIFT_CATEGORY_CHANGE:
+                    report["flags"].append(f"{label}: {shares[k]:.1%} of patients vs "
+                                           f"{self.training_shares[k]:.1%} in training")
+            report["categories"][label] = entry
+        if self.training_shares is not None:
+            report["category_psi"] = _psi(shares, self.training_shares)
+        return report
+
+    # ─── persistence ─────────────────────────────────────────────────────────
+
+    def state(self):
+        """Running state as plain lists, e.g. to carry it across restarts."""
+        with self._lock:
+            return {
+                "reference": self.reference(), "n": self.n,
+                "mean": self.mean.tolist(), "m2": self.m2.tolist(),
+                "histogram": self.histogram.tolist(), "category_counts": self.category_counts.tolist(),
+            }
+
+    def restore(self, state):
+        """Continue from a state() of a monitor with the same reference (see same_reference)."""
+        if "reference" not in state or not _same_reference(state["reference"], self.reference()):
+            raise ValueError("drift state was recorded against a different training reference")
+        with self._lock:
+            self.n = int(state["n"])
+            self.mean = np.array(state["mean"], dtype=float)
+            self.m2 = np.array(state["m2"], dtype=float)
+            self.histogram = np.array(state["histogram"], dtype=np.int64)
+            self.category_counts = np.array(state["category_counts"], dtype=np.int64)
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state(), f)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """Restore from ``path`` if it exists; returns True if state was loaded."""
+        if not os.path.exists(path):
+            return False
+        with open(path, encoding="utf-8") as f:
+            self.restore(json.load(f))
+        return True
@@ -0,0 +1,489 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP LOAD TEST
+# Concurrent synthetic sessions against the calculator or a scoring endpoint
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Usage:
+#   python pulse_iabp_loadtest.py http --url http://localhost:8000/score --users 1,4,16,64 --pid 1234
+#   python pulse_iabp_loadtest.py http --url http://localhost:8000/score/batch --batch-size 50 --rate 20
+#   streamlit run pulse_iabp_calculator.py &
+#   python pulse_iabp_loadtest.py calculator --users 1,4,16,64 --think-ms 2000 --pid $! --out load.json
+#
+# Each virtual user replays sessions built from seeded synthetic patients (the
+# same slider-grid sampler as pulse_iabp_benchmark):
+#
+#   http        one POST per step over a kept-alive connection; any endpoint that
+#               accepts one patient object, or {"patients": [...]} with --batch-size
+#   calculator  a clinician at a running calculator (--url): open the
+#               page, then per step change one to three inputs and press CALCULATE.
+#               The client speaks Streamlit's own websocket protocol (tornado and the
+#               protobuf messages ship with streamlit), so the server does exactly the
+#               work a browser tab causes, including fragment-only reruns; nothing is
+#               rendered client-side. Sessions reconnect every --session-steps steps.
+#
+# Load is closed-loop by default: --users N sessions, each starting its next step
+# --think-ms after the previous one finished. With --rate R, steps instead arrive as
+# a Poisson process of R per second served by the --users workers, and latency is
+# measured from the scheduled arrival, so queueing behind a saturated server counts.
+#
+# Passing several --users values runs one step of the sweep per value. Each step
+# reports p50/p95/p99 latency, error rate, throughput and, for every process
+# sampled (--pid, once per server worker process), mean and peak CPU % and peak
+# RSS. Saturation throughput is the highest throughput in the sweep, reached at
+# the smallest user count within 5% of it; with --slo-ms it is also reported as
+# the highest throughput whose p95 stays within the SLO. Calculator page loads
+# (opening a session) are reported on their own under "page_loads" and are left out
+# of the calculation latency, throughput and saturation; with --rate they run
+# outside the arrival schedule.
+# CPU and RSS come from psutil when installed, otherwise from /proc (Linux).
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from pulse_iabp_benchmark import synthetic_patients
+from pulse_iabp_model import FEATURE_SPECS
+
+DEFAULT_DURATION_SECONDS = 20.0
+SAMPLE_INTERVAL_SECONDS = 0.5
+SATURATION_FRACTION = 0.95
+FEATURES = [spec.name for spec in FEATURE_SPECS]
+
+# Kind of the calculator's session-opening step, summarised apart from calculations
+PAGE_LOAD = "page_load"
+
+DEFAULT_URLS = {"http": "http://localhost:8000/score", "calculator": "http://localhost:8501"}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PROCESS SAMPLING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _read_process(pid):
+    """(CPU seconds used, RSS bytes) of ``pid``."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        process = psutil.Process(pid)
+        times = process.cpu_times()
+        return times.user + times.system, process.memory_info().rss
+    with open(f"/proc/{pid}/stat") as f:
+        # Fields after the parenthesised command name; utime and stime are 14 and 15
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    with open(f"/proc/{pid}/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu_seconds, rss
+
+
+class ResourceSampler:
+    """CPU % and RSS of a set of processes, sampled on a background thread."""
+
+    def __init__(self, pids, interval=SAMPLE_INTERVAL_SECONDS):
+        self.pids = list(pids)
+        self.interval = interval
+        self.samples = {pid: [] for pid in self.pids}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pulse-iabp-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        last = {}
+        for pid in self.pids:
+            try:
+                last[pid] = (time.monotonic(), *_read_process(pid))
+            except (OSError, ValueError):
+                continue
+        while not self._stop.wait(self.interval):
+            for pid in last:
+                try:
+                    now, cpu, rss = time.monotonic(), *_read_process(pid)
+                except (OSError, ValueError):
+                    continue
+                then, cpu_then, _ = last[pid]
+                self.samples[pid].append((100.0 * (cpu - cpu_then) / (now - then), rss))
+                last[pid] = (now, cpu, rss)
+
+    def summary(self):
+        result = {}
+        for pid, samples in self.samples.items():
+            if not samples:
+                continue
+            cpu = np.array([s[0] for s in samples])
+            rss = np.array([s[1] for s in samples])
+            result[str(pid)] = {
+                "cpu_mean_pct": float(cpu.mean()),
+                "cpu_max_pct": float(cpu.max()),
+                "rss_max_mb": float(rss.max() / 2**20),
+            }
+        return result
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# VIRTUAL USERS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _patient_record(x):
+    return {spec.name: (int(v) if spec.is_binary else float(v)) for spec, v in zip(FEATURE_SPECS, x)}
+
+
+class HttpUser:
+    """One client with its own kept-alive connection to a scoring endpoint."""
+
+    def __init__(self, url, patients, batch_size=0, offset=0, timeout=30.0):
+        self._parts = urlsplit(url)
+        self.timeout = timeout
+        self.path = self._parts.path or "/"
+        self.patients = patients
+        self.batch_size = batch_size
+        self._conn = self._connect()
+        self._next = offset
+
+    def _connect(self):
+        https = self._parts.scheme == "https"
+        connection = http.client.HTTPSConnection if https else http.client.HTTPConnection
+        return connection(self._parts.hostname, self._parts.port, timeout=self.timeout)
+
+    def next_step_kind(self):
+        return "request"
+
+    def step(self):
+        """Send one request; True on a 2xx response."""
+        n = max(self.batch_size, 1)
+        rows = [self.patients[(self._next + i) % len(self.patients)] for i in range(n)]
+        self._next += n
+        payload = {"patients": [_patient_record(x) for x in rows]} if self.batch_size else _patient_record(rows[0])
+        try:
+            self._conn.request("POST", self.path, json.dumps(payload), {"Content-Type": "application/json"})
+            response = self._conn.getresponse()
+            response.read()
+            return 200 <= response.status < 300
+        except (OSError, http.client.HTTPException):
+            self._conn.close()
+            self._conn = self._connect()
+            return False
+
+    def close(self):
+        self._conn.close()
+
+
+class CalculatorUser:
+    """One clinician at the calculator, speaking Streamlit's websocket protocol.
+
+    A session opens the page (a full script run), then each step changes one to
+    three inputs and presses CALCULATE, which the server answers with a rerun of
+    the calculator fragment only, as it does for a browser. After
+    ``session_steps`` steps the session is closed and a new one opened.
+    """
+
+    def __init__(self, url, patients, seed, session_steps=10, timeout=60.0):
+        import asyncio
+
+        parts = urlsplit(url)
+        scheme = "wss" if parts.scheme == "https" else "ws"
+        self.ws_url = f"{scheme}://{parts.netloc}{parts.path.rstrip('/')}/_stcore/stream"
+        self.patients = patients
+        self.rng = np.random.default_rng(seed)
+        self.session_steps = session_steps
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self._ws = None
+        self._steps = 0
+
+    def next_step_kind(self):
+        """PAGE_LOAD if the next step opens a session, else "calculation"."""
+        return PAGE_LOAD if self._ws is None or self._steps >= self.session_steps else "calculation"
+
+    def step(self):
+        """One page load or one calculation; True if the run finished without an exception."""
+        import asyncio
+
+        return self.loop.run_until_complete(asyncio.wait_for(self._step(), self.timeout))
+
+    async def _rerun(self, widget_states=(), fragment_id=None):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.widget_states.widgets.extend(widget_states)
+        if fragment_id:
+            message.rerun_script.fragment_id = fragment_id
+        await self._ws.write_message(message.SerializeToString(), binary=True)
+        elements = []
+        while True:
+            data = await self._ws.read_message()
+            if data is None:
+                raise ConnectionError("websocket closed")
+            forward = ForwardMsg()
+            forward.ParseFromString(data)
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                elements.append((forward.delta.new_element, forward.delta.fragment_id))
+            elif kind == "script_finished":
+                # 0 = full run and 3 = fragment run finished successfully
+                ok = forward.script_finished in (0, 3)
+                return ok and not any(element.WhichOneof("type") == "exception" for element, _ in elements), elements
+
+    def _open_widgets(self, elements):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        # Widget ids end in the widget key ("$$ID-<hash>-lactate"); the button has none
+        self._widgets, self._button, self._fragment_id = {}, None, None
+        for element, fragment_id in elements:
+            kind = element.WhichOneof("type")
+            if kind not in ("slider", "radio", "button"):
+                continue
+            proto = getattr(element, kind)
+            if kind == "button":
+                self._button, self._fragment_id = proto.id, fragment_id
+                continue
+            state = WidgetState(id=proto.id)
+            if kind == "slider":
+                state.double_array_value.data.extend(proto.default)
+            else:
+                state.int_value = proto.default
+            self._widgets[proto.id.rsplit("-", 1)[1]] = state
+
+    async def _step(self):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        from tornado.websocket import websocket_connect
+
+        if self.next_step_kind() == PAGE_LOAD:
+            await self._disconnect()
+            self._ws = await websocket_connect(self.ws_url)
+            self._steps = 0
+            ok, elements = await self._rerun()
+            self._open_widgets(elements)
+            return ok
+
+        patient = self.patients[self.rng.integers(len(self.patients))]
+        for j in self.rng.choice(len(FEATURE_SPECS), self.rng.integers(1, 4), replace=False):
+            spec = FEATURE_SPECS[j]
+            state = self._widgets[spec.key]
+            if spec.is_binary:
+                state.int_value = int(patient[j])
+            else:
+                state.double_array_value.data[:] = [round(float(patient[j]), 1)]
+        self._steps += 1
+        press = WidgetState(id=self._button, trigger_value=True)
+        ok, _ = await self._rerun(list(self._widgets.values()) + [press], self._fragment_id)
+        return ok
+
+    async def _disconnect(self):
+        if self._ws is not None:
+            self._ws.close()
+            self._ws = None
+
+    def close(self):
+        self.loop.run_until_complete(self._disconnect())
+        self.loop.close()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LOAD PATTERNS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _worker(user, deadline, think, schedule, records):
+    try:
+        while True:
+            kind = user.next_step_kind()
+            # Page loads open a session; they never take a scheduled arrival
+            if schedule is None or kind == PAGE_LOAD:
+                arrival = time.perf_counter()
+                if arrival >= deadline:
+                    return
+            else:
+                try:
+                    arrival = next(schedule)
+                except StopIteration:
+                    return
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            try:
+                ok = user.step()
+            except Exception:
+                ok = False
+            records.append((time.perf_counter() - arrival, ok, kind))
+            if think and schedule is None:
+                time.sleep(think)
+    finally:
+        user.close()
+
+
+class _Schedule:
+    """Thread-safe iterator over Poisson arrival times (perf_counter seconds)."""
+
+    def __init__(self, rate, start, deadline, seed):
+        gaps = np.random.default_rng(seed).exponential(1.0 / rate, int(rate * (deadline - start) * 2) + 16)
+        times = start + np.cumsum(gaps)
+        self._times = iter(times[times < deadline].tolist())
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._lock:
+            return next(self._times)
+
+
+def run_load(make_user, users, duration, think_ms=0.0, rate=None, pids=(), seed=0):
+    """Drive ``users`` virtual users for ``duration`` seconds and summarise the step."""
+    workers = [make_user(k) for k in range(users)]
+    records = []
+    with ResourceSampler(pids) as sampler:
+        start = time.perf_counter()
+        deadline = start + duration
+        schedule = _Schedule(rate, start, deadline, seed) if rate else None
+        threads = [
+            threading.Thread(target=_worker, args=(user, deadline, think_ms / 1000, schedule, records), daemon=True)
+            for user in workers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    return summarize(records, elapsed, users, rate, sampler.summary())
+
+
+def _record_stats(records, elapsed):
+    latency = np.array([r[0] for r in records]) * 1e3
+    errors = sum(not r[1] for r in records)
+    stats = {
+        "requests": len(records),
+        "errors": errors,
+        "error_rate": errors / len(records) if records else 0.0,
+        "throughput_per_s": (len(records) - errors) / elapsed,
+    }
+    if len(latency):
+        stats["latency_ms"] = {
+            "p50": float(np.percentile(latency, 50)),
+            "p95": float(np.percentile(latency, 95)),
+            "p99": float(np.percentile(latency, 99)),
+            "mean": float(latency.mean()),
+            "max": float(latency.max()),
+        }
+    return stats
+
+
+def summarize(records, elapsed, users, rate, workers):
+    """Latency and throughput of the scoring steps; calculator page loads under "page_loads"."""
+    page_loads = [r for r in records if r[2] == PAGE_LOAD]
+    step = {
+        "users": users,
+        "arrival_rate": rate,
+        **_record_stats([r for r in records if r[2] != PAGE_LOAD], elapsed),
+        "elapsed_s": elapsed,
+        "workers": workers,
+    }
+    if page_loads:
+        step["page_loads"] = _record_stats(page_loads, elapsed)
+    return step
+
+
+def saturation(steps, slo_ms=None):
+    """Highest throughput in a sweep and the smallest user count reaching ~it."""
+    if not steps:
+        return None
+    best = max(step["throughput_per_s"] for step in steps)
+    knee = min((step for step in steps if step["throughput_per_s"] >= SATURATION_FRACTION * best),
+               key=lambda step: step["users"])
+    result = {"throughput_per_s": best, "users": knee["users"]}
+    if slo_ms is not None:
+        within = [step for step in steps
+                  if "latency_ms" in step and step["latency_ms"]["p95"] <= slo_ms and step["error_rate"] == 0]
+        result["slo_ms"] = slo_ms
+        result["throughput_within_slo_per_s"] = max((s["throughput_per_s"] for s in within), default=0.0)
+    return result
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMMAND LINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the PULSE-IABP calculator or scoring service.")
+    parser.add_argument("target", choices=("http", "calculator"))
+    parser.add_argument("--url", help="scoring endpoint or calculator page (default: %s, %s)"
+                        % tuple(DEFAULT_URLS.values()))
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help='patients per request as {"patients": [...]}; 0 sends one object (default)')
+    parser.add_argument("--session-steps", type=int, default=10,
+                        help="calculations per calculator session before it reconnects (default: %(default)s)")
+    parser.add_argument("--users", default="1,2,4,8,16",
+                        help="comma-separated concurrent users, one sweep step each (default: %(default)s)")
+    parser.add_argument("--rate", type=float, help="open-loop arrivals per second instead of closed-loop users")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause between a user's steps (closed loop)")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_SECONDS,
+                        help="seconds per sweep step (default: %(default)s)")
+    parser.add_argument("--pid", type=int, action="append", default=[],
+                        help="server process to sample for CPU/RSS; repeat for each worker")
+    parser.add_argument("--slo-ms", type=float, help="p95 latency target for the saturation report")
+    parser.add_argument("--seed", type=int, default=0, help="synthetic patient seed (default: %(default)s)")
+    parser.add_argument("--out", help="write the full results as JSON")
+    args = parser.parse_args(argv)
+
+    url = args.url or DEFAULT_URLS[args.target]
+    patients = synthetic_patients(1000, FEATURES, args.seed)
+
+    def make_http_user(k):
+        return HttpUser(url, patients, args.batch_size, offset=k * 97)
+
+    def make_calculator_user(k):
+        return CalculatorUser(url, patients, args.seed + k, args.session_steps)
+
+    make_user = make_http_user if args.target == "http" else make_calculator_user
+
+    steps = []
+    for users in (int(u) for u in args.users.split(",")):
+        step = run_load(make_user, users, args.duration, args.think_ms, args.rate, args.pid, args.seed)
+        steps.append(step)
+        latency = step.get("latency_ms", {})
+        cpu = " ".join(f"{pid}:{w['cpu_mean_pct']:.0f}%/{w['rss_max_mb']:.0f}MB" for pid, w in step["workers"].items())
+        print(f"users {users:>4}  {step['throughput_per_s']:8.1f}/s  "
+              f"p50 {latency.get('p50', float('nan')):7.1f} ms  p95 {latency.get('p95', float('nan')):7.1f} ms  "
+              f"p99 {latency.get('p99', float('nan')):7.1f} ms  errors {step['error_rate']:.1%}  {cpu}")
+        if "page_loads" in step:
+            loads = step["page_loads"]
+            print(f"            {loads['requests']:>6} page loads  "
+                  f"p50 {loads.get('latency_ms', {}).get('p50', float('nan')):7.1f} ms  "
+                  f"errors {loads['error_rate']:.1%}")
+
+    results = {
+        "target": args.target,
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "steps": steps,
+        "saturation": saturation(steps, args.slo_ms),
+    }
+    sat = results["saturation"]
+    print(f"Saturation: {sat['throughput_per_s']:.1f}/s from {sat['users']} users", end="")
+    print(f"; {sat['throughput_within_slo_per_s']:.1f}/s within p95 ≤ {args.slo_ms:g} ms" if args.slo_ms else "")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP METRICS
+# Opt-in per-stage latency histograms and prediction counters
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Enable with PULSE_IABP_METRICS=1, or set PULSE_IABP_METRICS_FILE to a path that
+# is rewritten (at most every PULSE_IABP_METRICS_INTERVAL seconds) in Prometheus
+# text format, e.g. for the node_exporter textfile collector. The scoring service
+# also serves the same text at GET /metrics.
+#
+# When disabled, metrics.stage() returns a shared no-op context manager and the
+# other calls return immediately.
+
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+METRICS_FILE = os.environ.get("PULSE_IABP_METRICS_FILE")
+METRICS_INTERVAL_SECONDS = float(os.environ.get("PULSE_IABP_METRICS_INTERVAL", "5"))
+ENABLED = os.environ.get("PULSE_IABP_METRICS", "").lower() in ("1", "true", "yes") or bool(METRICS_FILE)
+
+# Histogram upper bounds in seconds (Prometheus "le" labels)
+STAGE_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+_NULL_STAGE = nullcontext()
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, n_buckets):
+        self.counts = [0] * (n_buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Per-stage latency histograms and per-category prediction counters."""
+
+    def __init__(self, enabled=ENABLED, buckets=STAGE_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._predictions = {}
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+
+    def stage(self, name):
+        """Context manager timing one pipeline stage."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self, name)
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = _Histogram(len(self.buckets))
+            histogram.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+
+    def count_prediction(self, category, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._predictions[category] = self._predictions.get(category, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._predictions.clear()
+
+    # ─── export ──────────────────────────────────────────────────────────────
+
+    def render_prometheus(self):
+        """Current values in the Prometheus text exposition format."""
+        lines = [
+            "# HELP pulse_iabp_stage_seconds Latency of each scoring pipeline stage.",
+            "# TYPE pulse_iabp_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'pulse_iabp_stage_seconds_bucket{{stage="{name}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'pulse_iabp_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'pulse_iabp_stage_seconds_sum{{stage="{name}"}} {histogram.sum:.9f}')
+                lines.append(f'pulse_iabp_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+            lines.append("# HELP pulse_iabp_predictions_total Predictions by risk category.")
+            lines.append("# TYPE pulse_iabp_predictions_total counter")
+            for category, count in sorted(self._predictions.items()):
+                lines.append(f'pulse_iabp_predictions_total{{category="{category}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Atomically replace ``path`` with the current Prometheus text."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp, path)
+
+    def maybe_write(self, path=METRICS_FILE, interval=METRICS_INTERVAL_SECONDS):
+        """Write to ``path`` if configured and ``interval`` has passed since the last write."""
+        if not self.enabled or not path:
+            return
+        now = time.monotonic()
+        if now - self._last_write >= interval:
+            self._last_write = now
+            self.write(path)
+
+
+metrics = Metrics()
@@ -0,0 +1,211 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP MODEL HELPERS
+# Shared bundle loading and risk stratification for the calculator and tooling
+# ═══════════════════════════════════════════════════════════════════════════════
+
+import math
+import pickle
+from typing import NamedTuple
+
+import numpy as np
+
+BUNDLE_PATH = "model_bundle.pkl"
+
+# (label, colour, indicator) per category, ordered LOW → VERY HIGH
+RISK_CATEGORIES = (
+    ("LOW RISK", "#28a745", "🟢"),
+    ("MEDIUM RISK", "#ffc107", "🟡"),
+    ("HIGH RISK", "#fd7e14", "🟠"),
+    ("VERY HIGH RISK", "#dc3545", "🔴"),
+)
+
+
+class FeatureSpec(NamedTuple):
+    """One model input: how the calculator asks for it and which values it accepts.
+
+    Binary features are entered as a choice and encoded as the index of the chosen
+    option (No → 0, Yes → 1); continuous features are sliders over [low, high].
+    """
+    name: str
+    label: str          # widget label in the calculator
+    short_label: str    # axis / contributor label
+    section: str        # calculator section header
+    column: int         # column within the section
+    key: str            # Streamlit widget key
+    low: float
+    high: float
+    step: float
+    default: float
+    choices: tuple = ()
+
+    @property
+    def is_binary(self):
+        return bool(self.choices)
+
+    def display(self, value):
+        """Value as shown to the user ("Yes" rather than 1 for binary features)."""
+        return self.choices[int(value)] if self.choices else value
+
+
+_NO_YES = ("No", "Yes")
+
+# Every model input, in calculator order. Sections and columns lay out the widgets;
+# ranges, steps and encodings are shared with validation, caching and the tooling.
+FEATURE_SPECS = (
+    FeatureSpec("age", "Age (years)", "Age (years)",
+                "PATIENT DEMOGRAPHICS", 0, "age", 18, 100, 1, 65),
+    FeatureSpec("beta_blocker_use", "β-Blocker Therapy", "β-Blocker therapy",
+                "PHARMACOTHERAPY", 0, "bb", 0, 1, 1, 1, _NO_YES),
+    FeatureSpec("acei_use", "ACE Inhibitor Therapy", "ACE inhibitor therapy",
+                "PHARMACOTHERAPY", 1, "acei", 0, 1, 1, 0, _NO_YES),
+    FeatureSpec("ticagrelor_use", "Ticagrelor Therapy", "Ticagrelor therapy",
+                "PHARMACOTHERAPY", 2, "tica", 0, 1, 1, 0, _NO_YES),
+    FeatureSpec("invasive_ventilation", "Invasive Mechanical Ventilation", "Invasive mechanical ventilation",
+                "CRITICAL CARE INTERVENTIONS", 0, "vent", 0, 1, 1, 0, _NO_YES),
+    FeatureSpec("underwent_CPR", "Cardiopulmonary Resuscitation", "Cardiopulmonary resuscitation",
+                "CRITICAL CARE INTERVENTIONS", 1, "cpr", 0, 1, 1, 0, _NO_YES),
+    FeatureSpec("underwent_CRRT", "Continuous Renal Replacement", "Continuous renal replacement",
+                "CRITICAL CARE INTERVENTIONS", 2, "crrt", 0, 1, 1, 0, _NO_YES),
+    FeatureSpec("hemoglobin_min", "Hemoglobin, minimum (g/L)", "Hemoglobin, min (g/L)",
+                "HEMATOLOGY", 0, "hgb_min", 40, 180, 1, 110),
+    FeatureSpec("hemoglobin_max", "Hemoglobin, peak (g/L)", "Hemoglobin, peak (g/L)",
+                "HEMATOLOGY", 0, "hgb_max", 40, 180, 1, 135),
+    FeatureSpec("rbc_count_max", "RBC count, peak (×10¹²/L)", "RBC, peak (×10¹²/L)",
+                "HEMATOLOGY", 0, "rbc", 2.0, 7.0, 0.1, 4.5),
+    FeatureSpec("neutrophils_abs_min", "Neutrophils, minimum (×10⁹/L)", "Neutrophils, min (×10⁹/L)",
+                "HEMATOLOGY", 1, "neut_abs", 0.0, 30.0, 0.1, 5.0),
+    FeatureSpec("neutrophils_pct_min", "Neutrophils, minimum (%)", "Neutrophils, min (%)",
+                "HEMATOLOGY", 1, "neut_pct", 0, 100, 1, 70),
+    FeatureSpec("eGFR_CKD_EPI_21", "eGFR CKD-EPI 2021 (mL/min/1.73m²)", "eGFR (mL/min/1.73m²)",
+                "RENAL FUNCTION", 0, "egfr", 5, 120, 1, 75),
+    FeatureSpec("glucose_min", "Glucose, minimum (mmol/L)", "Glucose, min (mmol/L)",
+                "METABOLIC & ELECTROLYTES", 0, "glucose", 1.5, 30.0, 0.1, 6.0),
+    FeatureSpec("lactate_max", "Lactate, peak (mmol/L)", "Lactate, peak (mmol/L)",
+                "METABOLIC & ELECTROLYTES", 1, "lactate", 0.0, 20.0, 0.1, 2.5),
+    FeatureSpec("sodium_max", "Sodium, peak (mmol/L)", "Sodium, peak (mmol/L)",
+                "METABOLIC & ELECTROLYTES", 2, "sodium", 115, 165, 1, 140),
+)
+
+FEATURE_REGISTRY = {spec.name: spec for spec in FEATURE_SPECS}
+
+# (min, max, step) of each calculator widget
+SLIDER_RANGES = {spec.name: (spec.low, spec.high, spec.step) for spec in FEATURE_SPECS}
+
+# Features entered on a slider rather than as a No/Yes radio
+CONTINUOUS_FEATURES = tuple(spec.name for spec in FEATURE_SPECS if not spec.is_binary)
+
+FEATURE_LABELS = {spec.name: spec.short_label for spec in FEATURE_SPECS}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LOAD MODEL
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def load_bundle(path=BUNDLE_PATH):
+    """Unpickle the model bundle (models, features, thresholds, performance)."""
+    with open(path, "rb") as f:
+        bundle = pickle.load(f)
+    check_features(bundle["model_info"]["features"])
+    return bundle
+
+
+def check_features(features):
+    """ValueError unless ``features`` (the bundle's order) matches FEATURE_REGISTRY."""
+    unknown = [f for f in features if f not in FEATURE_REGISTRY]
+    unused = [f for f in FEATURE_REGISTRY if f not in features]
+    if unknown or unused or len(set(features)) != len(features):
+        raise ValueError(
+            f"model features do not match the feature registry "
+            f"(unregistered: {', '.join(unknown) or 'none'}; not in model: {', '.join(unused) or 'none'})"
+        )
+
+
+def assemble_features(values, features):
+    """(n, n_features) array from {feature: scalar or column}, in the model's order."""
+    return np.column_stack([np.asarray(values[f], dtype=float).reshape(-1) for f in features])
+
+
+def record_to_row(record, features):
+    """Feature vector from a {feature: value} mapping; ValueError if it cannot be scored."""
+    if not isinstance(record, dict):
+        raise ValueError("expected an object of feature values")
+    missing = [f for f in features if f not in record]
+    if missing:
+        raise ValueError(f"missing features {', '.join(missing)}")
+    row = np.empty(len(features))
+    for j, feature in enumerate(features):
+        value = record[feature]
+        # bool is an int subclass; JSON true/false must not pass as 1/0
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{feature} must be a finite number")
+        try:
+            value = float(value)
+        except OverflowError:
+            # JSON integers are unbounded; 10**400 has no float
+            raise ValueError(f"{feature} must be a finite number") from None
+        if not math.isfinite(value):
+            raise ValueError(f"{feature} must be a finite number")
+        if FEATURE_REGISTRY[feature].is_binary and value not in (0, 1):
+            raise ValueError(f"{feature} must be 0 or 1")
+        row[j] = value
+    return row
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RISK STRATIFICATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def risk_cutoffs(thresholds):
+    """The category boundaries [low, medium, high] as a sorted array."""
+    return np.array([thresholds['low'], thresholds['medium'], thresholds['high']], dtype=float)
+
+
+def risk_category_index(probs, thresholds):
+    """Index into RISK_CATEGORIES for each probability (one searchsorted pass); NaN → -1."""
+    probs = np.asarray(probs, dtype=float)
+    index = np.searchsorted(risk_cutoffs(thresholds), probs, side="right")
+    return np.where(np.isnan(probs), -1, index)
+
+
+def get_risk_category(prob, thresholds):
+    """Get risk category based on Step 17A thresholds (0.25, 0.45, 0.70)"""
+    return RISK_CATEGORIES[int(np.searchsorted(risk_cutoffs(thresholds), prob, side="right"))]
+
+
+_CATEGORY_LABELS = np.array([label for label, _, _ in RISK_CATEGORIES] + [""], dtype=object)
+
+
+def risk_category_labels(probs, thresholds):
+    """Vectorised counterpart of get_risk_category returning labels only ("" for NaN)."""
+    return _CATEGORY_LABELS[risk_category_index(probs, thresholds)]
+
+
+def training_category_counts(bundle):
+    """(patients, deaths) per risk category in the training cohort, as float arrays, or None."""
+    training = bundle["risk_thresholds"].get("validation_results", {}).get("training")
+    if not training:
+        return None
+    patients = np.array([category["n"] for category in training["categories"]], dtype=float)
+    deaths = np.array([category["deaths"] for category in training["categories"]], dtype=float)
+    return patients, deaths
+
+
+def cochran_armitage(totals, deaths):
+    """Two-sided Cochran-Armitage trend test across ordered categories (scores 0, 1, 2, ...).
+
+    ``totals`` and ``deaths`` are (k,) per-category counts, or (b, k) for b tables at
+    once. Returns (z, p); both are NaN where the variance is zero.
+    """
+    from scipy.special import erfc
+
+    n_k = np.asarray(totals, dtype=float)
+    d_k = np.asarray(deaths, dtype=float)
+    s = np.arange(n_k.shape[-1], dtype=float)
+    n = n_k.sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s_bar = n_k @ s / n
+        p_bar = d_k.sum(axis=-1) / n
+        trend = (d_k * (s - s_bar[..., None])).sum(axis=-1)
+        variance = p_bar * (1.0 - p_bar) * (n_k @ (s * s) - (n_k @ s) ** 2 / n)
+        z = np.where(variance > 0, trend / np.sqrt(variance), np.nan)[()]
+    return z, erfc(np.abs(z) / math.sqrt(2.0))
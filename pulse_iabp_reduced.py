@@ -0,0 +1,183 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP REDUCED-SET APPROXIMATION
+# Fewer kernel centres for latency-critical scoring, with a verification report
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Usage:
+#   python pulse_iabp_reduced.py build [--centers 300] [--out model_artifact_reduced]
+#
+# The exact model evaluates 1461 support vectors across five folds and averages
+# five Platt sigmoids. The reduced model is a single RBF expansion over a few
+# hundred k-means centres (in the fold-averaged scaled space) whose coefficients
+# are refitted by least squares to the exact model's log-odds, so one sigmoid
+# reproduces the averaged probability. It is stored in the native artifact format
+# as a one-fold CompiledSVM and runs through the same fused kernel code.
+#
+# Centres and coefficients are fitted on the reference sample (the support vectors
+# in raw units) plus jittered copies of it. The header records a verification
+# report on the reference sample and on VERIFY_ROWS held-out patients drawn on the
+# calculator's slider grid (every input within its range, binary inputs 0 or 1):
+# maximum and mean probability error, and how many patients change risk category
+# at the low/medium/high thresholds. load_approximation() refuses the model unless
+# both samples meet the caller's tolerance and it was built from the current bundle.
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from pulse_iabp_artifact import (
+    HEADER_FILE, artifact_is_current, bundle_header, file_sha256, load_artifact, read_header, write_artifact,
+)
+from pulse_iabp_benchmark import synthetic_patients
+from pulse_iabp_compiled import CompiledSVM
+from pulse_iabp_model import BUNDLE_PATH, load_bundle, risk_category_labels
+
+REDUCED_PATH = "model_artifact_reduced"
+DEFAULT_CENTERS = 300
+
+# Jittered copies of the reference sample used for fitting, and their spread in SDs
+FIT_COPIES = 4
+JITTER_SD = 0.3
+
+# In-range patients the approximation is verified on; none of them is used for fitting
+VERIFY_ROWS = 20_000
+VERIFY_SAMPLES = ("reference", "in_range")
+
+
+def jittered_sample(compiled, copies, seed):
+    """Reference-sample rows resampled with Gaussian noise of JITTER_SD training SDs."""
+    reference = compiled.reference_sample()
+    rng = np.random.default_rng(seed)
+    rows = reference[rng.integers(0, len(reference), copies * len(reference))]
+    return rows + rng.normal(0.0, JITTER_SD, rows.shape) * compiled.scale.mean(axis=0)
+
+
+def reduce_model(compiled, n_centers=DEFAULT_CENTERS, seed=0):
+    """One-fold CompiledSVM approximating ``compiled`` with ``n_centers`` kernel centres."""
+    from sklearn.cluster import KMeans
+
+    X = np.vstack([compiled.reference_sample(), jittered_sample(compiled, FIT_COPIES, seed)])
+    p = np.clip(compiled.predict_proba(X)[:, 1], 1e-12, 1 - 1e-12)
+    log_odds = np.log(p / (1.0 - p))
+
+    mean, scale, gamma = compiled.mean.mean(axis=0), compiled.scale.mean(axis=0), compiled.gamma.mean()
+    Z = (X - mean) / scale
+    centers = KMeans(n_centers, n_init=1, random_state=seed).fit(Z).cluster_centers_
+
+    # exp(-γ‖z - c‖²) design matrix with an intercept column
+    sq_dist = (Z ** 2).sum(axis=1)[:, None] - 2.0 * Z @ centers.T + (centers ** 2).sum(axis=1)
+    design = np.column_stack([np.exp(-gamma * np.maximum(sq_dist, 0.0)), np.ones(len(Z))])
+    coef = np.linalg.lstsq(design, log_odds, rcond=None)[0]
+
+    # Platt parameters a = -1, b = 0 turn the fitted log-odds into P(death)
+    return CompiledSVM(
+        centers, np.zeros(n_centers, dtype=np.intp), coef[:-1], [coef[-1]], [gamma],
+        mean[None], scale[None], [-1.0], [0.0],
+    )
+
+
+def _sample_report(approx, compiled, X, thresholds):
+    exact = compiled.predict_proba(X)[:, 1]
+    fast = approx.predict_proba(X)[:, 1]
+    error = np.abs(fast - exact)
+    changed = int((risk_category_labels(fast, thresholds) != risk_category_labels(exact, thresholds)).sum())
+    return {
+        "rows": len(X),
+        "max_abs_error": float(error.max()),
+        "mean_abs_error": float(error.mean()),
+        "category_changes": changed,
+        "category_change_rate": changed / len(X),
+    }
+
+
+def verification_report(approx, compiled, thresholds, features, seed=1):
+    """Accuracy and speed of ``approx`` against ``compiled`` on the training and in-range samples."""
+    samples = {
+        "reference": compiled.reference_sample(),
+        "in_range": synthetic_patients(VERIFY_ROWS, features, seed),
+    }
+    report = {name: _sample_report(approx, compiled, X, thresholds) for name, X in samples.items()}
+    per_sample = [report[name] for name in samples]
+    report["max_abs_error"] = max(r["max_abs_error"] for r in per_sample)
+    report["category_change_rate"] = max(r["category_change_rate"] for r in per_sample)
+
+    X = samples["in_range"]
+    timings = []
+    for predictor in (compiled, approx):
+        start = time.perf_counter()
+        predictor.predict_proba(X)
+        timings.append(time.perf_counter() - start)
+    report["n_support_exact"] = len(compiled.dual_coef)
+    report["n_support_reduced"] = len(approx.dual_coef)
+    report["speedup"] = timings[0] / timings[1]
+    return report
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# EXPORT / LOAD
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def export_reduced(bundle, path=REDUCED_PATH, n_centers=DEFAULT_CENTERS, source_sha256=None):
+    """Fit, verify and save the reduced model; returns its header."""
+    compiled = CompiledSVM.from_bundle(bundle)
+    approx = reduce_model(compiled, n_centers)
+    header = bundle_header(bundle, source_sha256)
+    header["approximation"] = verification_report(approx, compiled, header["risk_thresholds"],
+                                                  header["model_info"]["features"])
+    return write_artifact(path, header, approx.arrays())
+
+
+def load_approximation(tolerance, max_change_rate, path=REDUCED_PATH, bundle_path=BUNDLE_PATH):
+    """(CompiledSVM, report) if the reduced model meets the tolerances, else (None, reason)."""
+    if not artifact_is_current(path, bundle_path):
+        return None, f"no reduced model built from the current bundle in {path}/"
+    report = read_header(path).get("approximation")
+    if report is None or any(name not in report for name in VERIFY_SAMPLES):
+        return None, f"{path}/ has no in-range verification report; rebuild it"
+    if report["max_abs_error"] > tolerance:
+        return None, f"max probability error {report['max_abs_error']:.4f} exceeds {tolerance:g}"
+    if report["category_change_rate"] > max_change_rate:
+        return None, (f"category change rate {report['category_change_rate']:.4f} "
+                      f"exceeds {max_change_rate:g}")
+    return load_artifact(path)[1], report
+
+
+def approximation_version(version, path=REDUCED_PATH):
+    """``version`` tagged as the reduced model in ``path``, e.g. "1.0.0+06fdb223d31e.reduced.3f1c09ab".
+
+    The suffix is the reduced header's digest, so every rebuild gets its own label.
+    """
+    return f"{version}.reduced.{file_sha256(os.path.join(path, HEADER_FILE))[:8]}"
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMMAND LINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the reduced-set PULSE-IABP approximation.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="write model_artifact_reduced/ from model_bundle.pkl")
+    build.add_argument("--bundle", default=BUNDLE_PATH, help="model bundle (default: %(default)s)")
+    build.add_argument("--out", default=REDUCED_PATH, help="artifact directory (default: %(default)s)")
+    build.add_argument("--centers", type=int, default=DEFAULT_CENTERS,
+                       help="kernel centres in the reduced model (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    header = export_reduced(load_bundle(args.bundle), args.out, args.centers, file_sha256(args.bundle))
+    report = header["approximation"]
+    print(f"Reduced {report['n_support_exact']} support vectors to {report['n_support_reduced']} centres "
+          f"({report['speedup']:.1f}× faster)")
+    for name in VERIFY_SAMPLES:
+        r = report[name]
+        print(f"  {name:<10} {r['rows']:>5} rows  max |Δp| {r['max_abs_error']:.4f}  "
+              f"mean |Δp| {r['mean_abs_error']:.5f}  category changes {r['category_changes']}")
+    print(f"Written to {args.out}/")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
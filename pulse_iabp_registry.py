@@ -0,0 +1,170 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP MODEL REGISTRY
+# Every model in the bundle, scored together, reloaded when the artifact changes
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# A ModelSet is an immutable snapshot of one bundle version: its header and every
+# compiled model (calibrated_svm, base_svm, ...). All models' folds are stacked
+# into one CompiledSVM, so comparing them costs a single kernel product.
+#
+# ModelRegistry holds the current ModelSet and, once started, polls the artifact
+# header and the bundle every PULSE_IABP_RELOAD_INTERVAL seconds (default 5; 0
+# disables). When either changes, the new version is loaded on the watcher thread
+# and published by replacing one reference. Callers take `registry.current` once
+# per request and keep using that snapshot, so requests in flight during a swap
+# finish on the version they started with. A failed reload keeps the old version.
+#
+# If the bundle's models cannot be compiled, or the compiled predictor deviates
+# from sklearn beyond its tolerance (ValueError), the snapshot holds the sklearn
+# models themselves. Probabilities stay correct, only slower; ModelSet.compiled
+# is False and predict_all scores each model separately.
+
+import os
+import threading
+import time
+
+from pulse_iabp_artifact import ARTIFACT_PATH, HEADER_FILE, PRIMARY_MODEL, load_models, model_version
+from pulse_iabp_compiled import CompiledSVM
+from pulse_iabp_model import BUNDLE_PATH, load_bundle
+
+RELOAD_INTERVAL_SECONDS = float(os.environ.get("PULSE_IABP_RELOAD_INTERVAL", "5"))
+
+
+def sklearn_models(bundle):
+    """{name: sklearn model} for every scoring model in the bundle; a bare SVC gets its scaler in front."""
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.pipeline import make_pipeline
+    from sklearn.svm import SVC
+
+    models = bundle["models"]
+    result = {}
+    for name, model in models.items():
+        if isinstance(model, CalibratedClassifierCV):
+            result[name] = model
+        elif isinstance(model, SVC) and model.probability and "scaler" in models:
+            result[name] = make_pipeline(models["scaler"], model)
+    return result
+
+
+def load_models_or_sklearn(bundle_path=BUNDLE_PATH, artifact_path=ARTIFACT_PATH):
+    """load_models, or the bundle's sklearn models when they cannot be compiled."""
+    try:
+        return load_models(bundle_path, artifact_path)
+    except ValueError:
+        bundle = load_bundle(bundle_path)
+        return bundle, sklearn_models(bundle)
+
+
+class ModelSet:
+    """Every model of one bundle version, with a single-pass predict_all."""
+
+    def __init__(self, bundle, models, fingerprint=None, version=None):
+        self.bundle = bundle
+        self.models = dict(models)
+        self.fingerprint = fingerprint
+        # model_info version + source digest (see model_version)
+        self.version = version or bundle["model_info"].get("version")
+        self.loaded_at = time.time()
+        self.primary = self.models[PRIMARY_MODEL]
+        # False when serving the sklearn fallback (see load_models_or_sklearn)
+        self.compiled = all(isinstance(model, CompiledSVM) for model in self.models.values())
+        self._stacked, self._fold_slices = None, {}
+        if self.compiled:
+            self._stacked, slices = CompiledSVM.stack(list(self.models.values()))
+            self._fold_slices = dict(zip(self.models, slices))
+
+    @property
+    def features(self):
+        return self.bundle["model_info"]["features"]
+
+    def predict_proba(self, X):
+        return self.primary.predict_proba(X)
+
+    def predict_all(self, X):
+        """{model name: P(death) array} from one stacked kernel evaluation."""
+        if self._stacked is None:
+            return {name: model.predict_proba(X)[:, 1] for name, model in self.models.items()}
+        fold_probs = self._stacked.fold_probabilities(X)
+        return {name: model.combine_folds(fold_probs[:, self._fold_slices[name]])
+                for name, model in self.models.items()}
+
+
+class ModelRegistry:
+    """The current ModelSet, hot-swapped when model_artifact/ or the bundle changes."""
+
+    def __init__(self, bundle_path=BUNDLE_PATH, artifact_path=ARTIFACT_PATH,
+                 interval=RELOAD_INTERVAL_SECONDS, loader=load_models_or_sklearn):
+        self.bundle_path = bundle_path
+        self.artifact_path = artifact_path
+        self.interval = interval
+        self.loader = loader
+        self.last_error = None
+        self._failed_fingerprint = None
+        self._current = None
+        self._listeners = []
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _fingerprint(self):
+        stamps = []
+        for path in (os.path.join(self.artifact_path, HEADER_FILE), self.bundle_path):
+            try:
+                stat = os.stat(path)
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    @property
+    def current(self):
+        """The ModelSet to use for one request; loaded on first access."""
+        current = self._current
+        return current if current is not None else self.load()
+
+    def load(self):
+        """Load the files as they are now and publish them as the current ModelSet."""
+        with self._load_lock:
+            fingerprint = self._fingerprint()
+            bundle, models = self.loader(self.bundle_path, self.artifact_path)
+            model_set = ModelSet(bundle, models, fingerprint, model_version(bundle, self.bundle_path))
+            self._current = model_set
+        for listener in list(self._listeners):
+            listener(model_set)
+        return model_set
+
+    def reload_if_changed(self):
+        """Reload if the files changed since the current version; True if swapped."""
+        fingerprint = self._fingerprint()
+        if self._current is not None and fingerprint == self._current.fingerprint:
+            return False
+        if fingerprint == self._failed_fingerprint:
+            return False
+        try:
+            self.load()
+        except Exception as e:
+            # Not retried until the files change again
+            self._failed_fingerprint = fingerprint
+            self.last_error = f"{type(e).__name__}: {e}"
+            return False
+        self.last_error = None
+        return True
+
+    def add_listener(self, callback):
+        """Call ``callback(model_set)`` on the loading thread after every swap."""
+        self._listeners.append(callback)
+
+    # ─── watcher ─────────────────────────────────────────────────────────────
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, name="pulse-iabp-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.reload_if_changed()
@@ -0,0 +1,276 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP RE-VALIDATION
+# Performance of the model on a local labelled cohort, with bootstrap intervals
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Usage:
+#   python pulse_iabp_revalidate.py cohort.csv --outcome died_1y
+#   python pulse_iabp_revalidate.py cohort.parquet --outcome died_1y --replicates 5000 --out report.json
+#
+# The cohort is scored once. The metrics reported in
+# performance.phase_b.external_confirmatory (AUC, Brier, calibration slope and
+# intercept, calibration-in-the-large, ECE, Hosmer-Lemeshow) and the
+# Cochran-Armitage trend test across risk categories are then recomputed on
+# every bootstrap replicate.
+#
+# A replicate is a row of a resampled index matrix, turned into per-patient
+# multiplicities, so each metric is a weighted sum over the same sorted cohort and
+# a whole block of replicates is evaluated with array operations. Blocks are
+# spread over a process pool and sized so that one block per worker fits in
+# PULSE_IABP_BOOTSTRAP_MEMORY_MB (default 1024). Every replicate draws from its own
+# child SeedSequence, so results depend only on --seed, not on the number of
+# workers or the block size.
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import chi2
+
+from pulse_iabp_artifact import ARTIFACT_PATH, load_predictor
+from pulse_iabp_batch import iter_cohort
+from pulse_iabp_model import BUNDLE_PATH, cochran_armitage, risk_category_index
+
+DEFAULT_REPLICATES = 2000
+HL_GROUPS = 10
+ECE_BINS = 10
+
+# Largest block; bigger blocks fall out of cache and run slower per replicate
+MAX_BLOCK_REPLICATES = 200
+# Memory all bootstrap blocks in flight may use together
+MEMORY_BUDGET_BYTES = int(float(os.environ.get("PULSE_IABP_BOOTSTRAP_MEMORY_MB", "1024")) * 2 ** 20)
+# (replicates × rows) float64 arrays alive at once while a block is evaluated (measured peak)
+BLOCK_ARRAYS = 10
+
+METRICS = (
+    "auc", "brier", "calibration_slope", "calibration_intercept", "citl_direct",
+    "ece", "hl_statistic", "hl_p_value", "cochran_armitage_z", "cochran_armitage_p",
+)
+
+
+class Cohort:
+    """Scored cohort sorted by predicted probability, with the fixed per-patient groupings."""
+
+    def __init__(self, prob, outcome, thresholds):
+        order = np.argsort(prob, kind="stable")
+        self.prob = np.asarray(prob, dtype=float)[order]
+        self.outcome = np.asarray(outcome, dtype=float)[order]
+        self.n = len(self.prob)
+        p = np.clip(self.prob, 1e-12, 1 - 1e-12)
+        self.logit = np.log(p / (1.0 - p))
+        # Tie groups of equal probabilities (for the AUC), ECE bins and risk categories
+        _, self.tie_group = np.unique(self.prob, return_inverse=True)
+        self.n_ties = self.tie_group.max() + 1
+        self.ece_bin = np.minimum((self.prob * ECE_BINS).astype(int), ECE_BINS - 1)
+        self.category = risk_category_index(self.prob, thresholds)
+
+
+def _grouped_sums(weights, groups, n_groups):
+    """Per-replicate sums of ``weights`` (b, n) within ``groups`` (n,) or (b, n)."""
+    b = len(weights)
+    groups = np.broadcast_to(groups, weights.shape)
+    flat = (groups + n_groups * np.arange(b)[:, None]).ravel()
+    return np.bincount(flat, weights=weights.ravel(), minlength=b * n_groups).reshape(b, n_groups)
+
+
+def _calibration_fit(cohort, counts, iterations=25):
+    """Weighted logistic regression of outcome on logit(p): (intercept, slope) per replicate."""
+    x, y = cohort.logit, cohort.outcome
+    theta = np.zeros((len(counts), 2))
+    theta[:, 1] = 1.0
+    for _ in range(iterations):
+        mu = 1.0 / (1.0 + np.exp(-(theta[:, :1] + theta[:, 1:] * x)))
+        residual = counts * (y - mu)
+        w = counts * mu * (1.0 - mu)
+        g0, g1 = residual.sum(axis=1), residual @ x
+        h00, h01, h11 = w.sum(axis=1), w @ x, w @ (x * x)
+        det = h00 * h11 - h01 * h01
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = np.column_stack([(h11 * g0 - h01 * g1) / det, (h00 * g1 - h01 * g0) / det])
+        theta += np.nan_to_num(step)
+        if np.nanmax(np.abs(step)) < 1e-10:
+            break
+    return theta[:, 0], theta[:, 1]
+
+
+def cohort_metrics(cohort, counts):
+    """Every metric for each replicate; ``counts`` (b, n) are per-patient multiplicities."""
+    p, y = cohort.prob, cohort.outcome
+    total = counts.sum(axis=1)
+    deaths = counts @ y
+    expected = counts @ p
+    results = {}
+
+    # AUC: for each positive, the weight of negatives below it (ties count half)
+    pos = _grouped_sums(counts * y, cohort.tie_group, cohort.n_ties)
+    neg = _grouped_sums(counts * (1.0 - y), cohort.tie_group, cohort.n_ties)
+    neg_below = np.cumsum(neg, axis=1) - neg
+    with np.errstate(divide="ignore", invalid="ignore"):
+        results["auc"] = (pos * (neg_below + 0.5 * neg)).sum(axis=1) / (deaths * (total - deaths))
+
+    results["brier"] = counts @ (p - y) ** 2 / total
+    results["calibration_intercept"], results["calibration_slope"] = _calibration_fit(cohort, counts)
+    results["citl_direct"] = (deaths - expected) / total
+
+    observed_bin = _grouped_sums(counts * y, cohort.ece_bin, ECE_BINS)
+    expected_bin = _grouped_sums(counts * p, cohort.ece_bin, ECE_BINS)
+    results["ece"] = np.abs(observed_bin - expected_bin).sum(axis=1) / total
+
+    # Hosmer-Lemeshow over deciles of risk; a patient's copies stay in one decile
+    cumulative = np.cumsum(counts, axis=1)
+    decile = np.minimum(((cumulative - counts / 2.0) * HL_GROUPS / total[:, None]).astype(int), HL_GROUPS - 1)
+    n_g = _grouped_sums(counts, decile, HL_GROUPS)
+    o_g = _grouped_sums(counts * y, decile, HL_GROUPS)
+    e_g = _grouped_sums(counts * p, decile, HL_GROUPS)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(n_g > 0, (o_g - e_g) ** 2 / (e_g * (1.0 - e_g / n_g)), 0.0)
+    results["hl_statistic"] = terms.sum(axis=1)
+    results["hl_p_value"] = chi2.sf(results["hl_statistic"], HL_GROUPS - 1)
+
+    # Cochran-Armitage trend in mortality across LOW → VERY HIGH (scores 0-3)
+    n_k = _grouped_sums(counts, cohort.category, 4)
+    d_k = _grouped_sums(counts * y, cohort.category, 4)
+    results["cochran_armitage_z"], results["cochran_armitage_p"] = cochran_armitage(n_k, d_k)
+    return results
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BOOTSTRAP
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_worker_cohort = None
+
+
+def _init_worker(cohort):
+    global _worker_cohort
+    try:
+        from threadpoolctl import threadpool_limits
+
+        threadpool_limits(1)
+    except ImportError:
+        pass
+    _worker_cohort = cohort
+
+
+def block_replicates(n_rows, n_replicates, workers=1, budget=MEMORY_BUDGET_BYTES):
+    """Replicates per block such that ``workers`` blocks of ``n_rows`` fit in ``budget`` bytes."""
+    fits = budget // (workers * n_rows * 8 * BLOCK_ARRAYS)
+    # at least one block per worker, and never less than one replicate
+    return int(max(1, min(MAX_BLOCK_REPLICATES, fits, -(-n_replicates // workers))))
+
+
+def bootstrap_block(cohort, seeds):
+    """Metrics for one resample per SeedSequence in ``seeds``, as one index matrix."""
+    index = np.stack([np.random.default_rng(s).integers(0, cohort.n, cohort.n) for s in seeds])
+    counts = _grouped_sums(np.ones(index.shape), index, cohort.n)
+    return cohort_metrics(cohort, counts)
+
+
+def _bootstrap_task(seeds):
+    return bootstrap_block(_worker_cohort, seeds)
+
+
+def bootstrap(cohort, n_replicates=DEFAULT_REPLICATES, seed=0, workers=1, budget=MEMORY_BUDGET_BYTES):
+    """{metric: (n_replicates,) array} from memory-bounded blocks, optionally in parallel."""
+    seeds = np.random.SeedSequence(seed).spawn(n_replicates)
+    size = block_replicates(cohort.n, n_replicates, workers, budget)
+    chunks = [seeds[start:start + size] for start in range(0, n_replicates, size)]
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(cohort,)) as pool:
+            blocks = list(pool.map(_bootstrap_task, chunks))
+    else:
+        blocks = [bootstrap_block(cohort, chunk) for chunk in chunks]
+    return {name: np.concatenate([block[name] for block in blocks]) for name in METRICS}
+
+
+def revalidate(cohort, n_replicates=DEFAULT_REPLICATES, seed=0, workers=1, confidence=0.95):
+    """{metric: {"estimate", "ci_low", "ci_high"}} with percentile bootstrap intervals."""
+    point = cohort_metrics(cohort, np.ones((1, cohort.n)))
+    replicates = bootstrap(cohort, n_replicates, seed, workers)
+    tail = (1.0 - confidence) / 2.0 * 100
+    report = {}
+    for name in METRICS:
+        values = replicates[name]
+        values = values[np.isfinite(values)]
+        low, high = np.percentile(values, [tail, 100 - tail]) if len(values) else (np.nan, np.nan)
+        report[name] = {"estimate": float(point[name][0]), "ci_low": float(low), "ci_high": float(high)}
+    report["hl_df"] = HL_GROUPS - 1
+    return report
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMMAND LINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def load_cohort(path, outcome, bundle_path=BUNDLE_PATH, artifact_path=ARTIFACT_PATH):
+    """Score ``path`` once; returns (Cohort, rows skipped for missing values, bundle)."""
+    bundle, model = load_predictor(bundle_path, artifact_path)
+    features = bundle["model_info"]["features"]
+    probs, outcomes, skipped = [], [], 0
+    for chunk in iter_cohort(path):
+        missing = [c for c in features + [outcome] if c not in chunk.columns]
+        if missing:
+            raise ValueError(f"Cohort is missing columns: {', '.join(missing)}")
+        X = chunk[features].to_numpy(dtype=float)
+        y = chunk[outcome].to_numpy(dtype=float)
+        complete = ~np.isnan(X).any(axis=1) & ~np.isnan(y)
+        if not np.isin(y[complete], (0, 1)).all():
+            raise ValueError(f"{outcome} must be coded 0/1")
+        skipped += int((~complete).sum())
+        if complete.any():
+            probs.append(model.predict_proba(X[complete])[:, 1])
+            outcomes.append(y[complete])
+    if not probs:
+        raise ValueError("No complete rows to validate")
+    return Cohort(np.concatenate(probs), np.concatenate(outcomes), bundle["risk_thresholds"]), skipped, bundle
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-validate PULSE-IABP on a labelled cohort.")
+    parser.add_argument("input", help="cohort CSV or Parquet file with the model features and an outcome")
+    parser.add_argument("--outcome", required=True, help="0/1 outcome column (1 = died)")
+    parser.add_argument("--replicates", type=int, default=DEFAULT_REPLICATES,
+                        help="bootstrap replicates (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="bootstrap processes (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="bootstrap seed (default: %(default)s)")
+    parser.add_argument("--out", help="write the report as JSON")
+    parser.add_argument("--bundle", default=BUNDLE_PATH, help="model bundle (default: %(default)s)")
+    parser.add_argument("--artifact", default=ARTIFACT_PATH, help="native artifact (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    try:
+        cohort, skipped, bundle = load_cohort(args.input, args.outcome, args.bundle, args.artifact)
+    except ValueError as e:
+        parser.exit(2, f"error: {e}\n")
+    start = time.perf_counter()
+    report = revalidate(cohort, args.replicates, args.seed, args.workers)
+    seconds = time.perf_counter() - start
+
+    published = bundle["performance"]["phase_b"]["external_confirmatory"]
+    print(f"{cohort.n:,} patients, {int(cohort.outcome.sum()):,} deaths"
+          + (f" ({skipped:,} incomplete rows skipped)" if skipped else ""))
+    print(f"{'metric':<24}{'estimate':>10}   {'95% CI':<22}{'published':>10}")
+    for name in METRICS:
+        r = report[name]
+        reference = f"{published[name]:.4f}" if name in published else ""
+        print(f"{name:<24}{r['estimate']:>10.4f}   [{r['ci_low']:.4f}, {r['ci_high']:.4f}]".ljust(58)
+              + f"{reference:>10}")
+    print(f"{args.replicates:,} bootstrap replicates in {seconds:.2f} s")
+
+    if args.out:
+        report["n"] = cohort.n
+        report["deaths"] = int(cohort.outcome.sum())
+        report["replicates"] = args.replicates
+        report["seed"] = args.seed
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP SENSITIVITY CURVES
+# Risk across each slider's range, evaluated in a single batched model call
+# ═══════════════════════════════════════════════════════════════════════════════
+
+import numpy as np
+
+from pulse_iabp_model import CONTINUOUS_FEATURES, SLIDER_RANGES
+
+DEFAULT_POINTS = 41
+
+
+def sensitivity_grid(x, features, n_points=DEFAULT_POINTS, ranges=SLIDER_RANGES,
+                     continuous=CONTINUOUS_FEATURES):
+    """Rows varying one continuous feature at a time, the others held at ``x``.
+
+    Returns (X, curves) where curves is a list of (feature, values, row slice into X),
+    in the order the calculator shows the sliders. Grid points are snapped to the
+    slider step, so they are values a user could enter.
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    blocks, curves, offset = [], [], 0
+    for feature in continuous:
+        if feature not in features:
+            continue
+        j = features.index(feature)
+        low, high, step = ranges[feature]
+        values = np.unique(np.round(np.linspace(low, high, n_points) / step) * step)
+        block = np.tile(x, (len(values), 1))
+        block[:, j] = values
+        blocks.append(block)
+        curves.append((feature, values, slice(offset, offset + len(values))))
+        offset += len(values)
+    return np.vstack(blocks), curves
+
+
+def sensitivity_curves(predict_proba, x, features, n_points=DEFAULT_POINTS):
+    """{feature: (values, probabilities)} for every continuous feature, from one predict_proba call."""
+    X, curves = sensitivity_grid(x, features, n_points)
+    probs = predict_proba(X)[:, 1]
+    return {feature: (values, probs[rows]) for feature, values, rows in curves}
@@ -0,0 +1,432 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP SCORING SERVICE
+# ASGI endpoints for programmatic scoring with request micro-batching
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Run with any ASGI server, e.g.:
+#   pip install uvicorn
+#   uvicorn pulse_iabp_service:app --host 0.0.0.0 --port 8000
+#
+# Endpoints:
+#   POST /score         {"age": 65, "lactate_max": 2.5, ...}       one patient
+#   POST /score/batch   {"patients": [{...}, {...}]}                many patients
+#   POST /score/compare {"age": 65, ...}    every model in the bundle, side by side
+#   GET  /health        liveness (always 200 while the process runs)
+#   GET  /ready         200 once the model is loaded, 503 before
+#   GET  /cache         prediction cache hit/miss counters
+#   GET  /drift         input and risk-mix drift against the training cohort
+#   GET  /metrics       stage latencies and category counts (PULSE_IABP_METRICS=1)
+#
+# Inputs are looked up in a PredictionCache before the kernel is evaluated; a hit
+# returns the probability the model gives for exactly those inputs.
+# Concurrent requests arriving within PULSE_IABP_BATCH_WAIT_MS (default 2 ms) are
+# coalesced into one predict_proba call of at most PULSE_IABP_MAX_BATCH rows.
+# Implausible inputs are still scored; each result lists them under "warnings".
+#
+# Setting PULSE_IABP_APPROX_TOLERANCE (a probability, e.g. 0.01) switches to the
+# reduced-set model in model_artifact_reduced/ when its verification report has
+# no larger error and at most PULSE_IABP_APPROX_MAX_CHANGE_RATE (default 0.005) of
+# patients change risk category; otherwise the exact model is used. GET /ready
+# reports which model is serving and why.
+#
+# Models come from a ModelRegistry: re-exporting model_artifact/ (or replacing the
+# bundle) is picked up within PULSE_IABP_RELOAD_INTERVAL seconds without a restart.
+#
+# With PULSE_IABP_AUDIT_DIR set, every /score and /score/batch result is queued for
+# the Parquet audit log (see pulse_iabp_audit); GET /ready reports its counters.
+#
+# Every scored patient also updates a DriftMonitor (see pulse_iabp_drift). Its
+# running state is kept across restarts in PULSE_IABP_DRIFT_STATE, if set. A reload
+# that changes the training reference (scaler statistics, thresholds or category
+# shares) starts a new monitor; otherwise the statistics carry on.
+
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from pulse_iabp_artifact import ARTIFACT_PATH
+from pulse_iabp_audit import audit_log_from_env
+from pulse_iabp_cache import PredictionCache
+from pulse_iabp_drift import DriftMonitor
+from pulse_iabp_metrics import metrics
+from pulse_iabp_model import BUNDLE_PATH, record_to_row, risk_category_labels
+from pulse_iabp_reduced import approximation_version, load_approximation
+from pulse_iabp_registry import ModelRegistry
+from pulse_iabp_validation import InputValidator
+
+BATCH_WAIT_SECONDS = float(os.environ.get("PULSE_IABP_BATCH_WAIT_MS", "2")) / 1000
+MAX_BATCH_ROWS = int(os.environ.get("PULSE_IABP_MAX_BATCH", "512"))
+MAX_BODY_BYTES = 10 * 1024 * 1024
+APPROX_TOLERANCE = os.environ.get("PULSE_IABP_APPROX_TOLERANCE")
+APPROX_MAX_CHANGE_RATE = float(os.environ.get("PULSE_IABP_APPROX_MAX_CHANGE_RATE", "0.005"))
+
+DRIFT_STATE_PATH = os.environ.get("PULSE_IABP_DRIFT_STATE")
+
+
+class RequestError(Exception):
+    """Client error reported as a JSON body with the given HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# MICRO-BATCHING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class MicroBatcher:
+    """Coalesce concurrent scoring requests into single predict_proba calls.
+
+    The model runs on one dedicated thread, so calls never overlap and the event
+    loop stays free to accept requests while a batch is being scored.
+    """
+
+    def __init__(self, predict_proba, max_rows=MAX_BATCH_ROWS, max_wait=BATCH_WAIT_SECONDS):
+        self.predict_proba = predict_proba
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pulse-iabp-model")
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def close(self):
+        """Stop once every request already submitted has been answered."""
+        await self._queue.join()
+        await self.stop()
+
+    async def submit(self, X):
+        """Queue rows for scoring; resolves to their P(death) array."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((X, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self._queue.get()]
+            # Give concurrent requests a few milliseconds to join this batch
+            if self.max_wait > 0:
+                await asyncio.sleep(self.max_wait)
+            n_rows = len(pending[0][0])
+            while n_rows < self.max_rows and not self._queue.empty():
+                item = self._queue.get_nowait()
+                pending.append(item)
+                n_rows += len(item[0])
+
+            try:
+                await self._score(loop, [(X, future) for X, future in pending if not future.cancelled()])
+            finally:
+                for _ in pending:
+                    self._queue.task_done()
+
+    async def _score(self, loop, pending):
+        if not pending:
+            return
+        X = np.vstack([X for X, _ in pending])
+        try:
+            probs = await loop.run_in_executor(self._executor, self._predict, X)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for rows, future in pending:
+            if not future.done():
+                future.set_result(probs[offset:offset + len(rows)])
+            offset += len(rows)
+
+    def _predict(self, X):
+        with metrics.stage("predict"):
+            return self.predict_proba(X)[:, 1]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SCORING SERVICE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class ActiveModel:
+    """Everything one model version needs to serve requests; replaced as a whole on reload."""
+
+    def __init__(self, models, approx_tolerance=None, bundle_path=BUNDLE_PATH, artifact_path=ARTIFACT_PATH):
+        self.models = models
+        self.bundle = models.bundle
+        self.model, self.scoring_model, self.approximation = models.primary, "exact", None
+        # Version of the model that actually produces the probabilities
+        self.version = models.version
+        if approx_tolerance is not None:
+            approx, self.approximation = load_approximation(
+                float(approx_tolerance), APPROX_MAX_CHANGE_RATE, bundle_path=bundle_path)
+            if approx is not None:
+                self.model, self.scoring_model = approx, "reduced"
+                self.version = approximation_version(models.version)
+        self.validator = InputValidator.from_bundle(self.bundle, artifact_path)
+        self.cache = PredictionCache(self.model.predict_proba, models.features)
+        self.batcher = MicroBatcher(self.cache.predict_proba)
+
+
+class ScoringService:
+    """Model state shared by every request handled by this process.
+
+    Each request takes ``self.active`` once and uses it throughout. A reload builds
+    a new ActiveModel off the event loop and swaps it in; the previous batcher
+    finishes the requests already queued on it before it stops.
+    """
+
+    def __init__(self, registry=None, approx_tolerance=APPROX_TOLERANCE):
+        self.registry = registry or ModelRegistry()
+        self.approx_tolerance = approx_tolerance
+        self.active = None
+        self.load_error = None
+        self.reload_error = None
+        self.audit = None
+        self.drift = None
+        self.drift_error = None
+        self._loop = None
+
+    @property
+    def ready(self):
+        return self.active is not None
+
+    async def startup(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop.create_task(self._load())
+
+    def _prepare(self, models):
+        return ActiveModel(models, self.approx_tolerance, self.registry.bundle_path, self.registry.artifact_path)
+
+    async def _load(self):
+        try:
+            models = await asyncio.to_thread(self.registry.load)
+            active = await asyncio.to_thread(self._prepare, models)
+        except Exception as e:
+            self.load_error = str(e)
+            return
+        self.drift = DriftMonitor.from_bundle(models.bundle, self.registry.artifact_path)
+        if DRIFT_STATE_PATH:
+            try:
+                self.drift.load(DRIFT_STATE_PATH)
+            except (OSError, ValueError) as e:
+                # A bad state file restarts the statistics rather than blocking startup
+                self.drift_error = f"ignored {DRIFT_STATE_PATH}: {e}"
+        self._activate(active)
+        self.audit = audit_log_from_env(models.features)
+        self.registry.add_listener(self._on_reload)
+        self.registry.start()
+
+    def _on_reload(self, models):
+        # Runs on the registry's watcher thread
+        try:
+            active = self._prepare(models)
+            drift = DriftMonitor.from_bundle(models.bundle, self.registry.artifact_path)
+        except Exception as e:
+            self.reload_error = f"{type(e).__name__}: {e}"
+            return
+        self.reload_error = None
+        if self.drift is not None and self.drift.same_reference(drift):
+            drift = self.drift
+        self._loop.call_soon_threadsafe(self._activate, active, drift)
+
+    def _activate(self, active, drift=None):
+        if drift is not None:
+            self.drift = drift
+        active.batcher.start()
+        previous, self.active = self.active, active
+        if previous is not None:
+            self._loop.create_task(previous.batcher.close())
+
+    async def shutdown(self):
+        self.registry.stop()
+        if self.active is not None:
+            await self.active.batcher.stop()
+        if self.audit is not None:
+            await asyncio.to_thread(self.audit.close)
+        if self.drift is not None and DRIFT_STATE_PATH:
+            self.drift.save(DRIFT_STATE_PATH)
+
+    @staticmethod
+    def to_matrix(patients, features):
+        """Validate patient dicts and assemble them into a (n, n_features) array."""
+        X = np.empty((len(patients), len(features)))
+        for i, patient in enumerate(patients):
+            try:
+                X[i] = record_to_row(patient, features)
+            except ValueError as e:
+                raise RequestError(422, f"patient {i}: {e}")
+        return X
+
+    @staticmethod
+    def to_results(active, probs, X):
+        thresholds = active.bundle["risk_thresholds"]
+        codes = active.validator.check(X)
+        categories = risk_category_labels(probs, thresholds)
+        results = []
+        for prob, category, code, x in zip(probs, categories, codes, X):
+            metrics.count_prediction(category)
+            results.append({
+                "probability": float(prob),
+                "risk_score": float(prob * 100),
+                "risk_category": category,
+                "model_version": active.version,
+                "warnings": active.validator.messages(x) if code else [],
+            })
+        return results
+
+    async def score(self, patients):
+        active = self.active
+        if not patients:
+            return []
+        X = self.to_matrix(patients, active.models.features)
+        probs = await active.batcher.submit(X)
+        results = self.to_results(active, probs, X)
+        self.drift.update(X, probs)
+        if self.audit is not None:
+            self.audit.record(X, probs, [r["risk_category"] for r in results], active.version, "service")
+        return results
+
+    async def compare(self, patients):
+        """Every bundle model's prediction per patient, from one stacked evaluation."""
+        active = self.active
+        X = self.to_matrix(patients, active.models.features)
+        probs = await asyncio.to_thread(active.models.predict_all, X)
+        thresholds = active.bundle["risk_thresholds"]
+        categories = {name: risk_category_labels(p, thresholds) for name, p in probs.items()}
+        return [
+            {name: {"probability": float(p[i]), "risk_score": float(p[i] * 100),
+                    "risk_category": categories[name][i]}
+             for name, p in probs.items()}
+            for i in range(len(patients))
+        ]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# ASGI APPLICATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+async def _read_json(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get("body", b""))
+        if len(body) > MAX_BODY_BYTES:
+            raise RequestError(413, "request body too large")
+        if not message.get("more_body", False):
+            break
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise RequestError(400, "request body is not valid JSON")
+
+
+async def _send(send, status, body, content_type):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status, payload):
+    await _send(send, status, json.dumps(payload).encode(), b"application/json")
+
+
+class ScoringApp:
+    """Minimal ASGI application; needs no web framework, only an ASGI server."""
+
+    def __init__(self, service=None):
+        self.service = service or ScoringService()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            if scope["path"] == "/metrics":
+                body = metrics.render_prometheus().encode()
+                await _send(send, 200, body, b"text/plain; version=0.0.4; charset=utf-8")
+                return
+            with metrics.stage("request"):
+                await self._handle(scope, receive, send)
+
+    async def _handle(self, scope, receive, send):
+        try:
+            status, payload = await self._route(scope, receive)
+        except RequestError as e:
+            status, payload = e.status, {"error": str(e)}
+        await _send_json(send, status, payload)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.service.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.service.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _route(self, scope, receive):
+        method, path = scope["method"], scope["path"].rstrip("/") or "/"
+        service = self.service
+
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/ready":
+            if service.ready:
+                active = service.active
+                return 200, {
+                    "status": "ready",
+                    "model_version": active.version,
+                    "models": list(active.models.models),
+                    "compiled": active.models.compiled,
+                    "loaded_at": active.models.loaded_at,
+                    "reload_error": service.registry.last_error or service.reload_error,
+                    "scoring_model": active.scoring_model,
+                    "approximation": active.approximation,
+                    "audit": service.audit.stats() if service.audit is not None else None,
+                }
+            return 503, {"status": "loading" if service.load_error is None else "failed",
+                         "error": service.load_error}
+
+        if path == "/cache":
+            if not service.ready:
+                raise RequestError(503, "model is not loaded yet")
+            return 200, service.active.cache.stats()
+
+        if path == "/drift":
+            if not service.ready:
+                raise RequestError(503, "model is not loaded yet")
+            return 200, dict(service.drift.report(), state_error=service.drift_error)
+
+        if path not in ("/score", "/score/batch", "/score/compare"):
+            raise RequestError(404, f"no route for {path}")
+        if method != "POST":
+            raise RequestError(405, f"{path} only accepts POST")
+        if not service.ready:
+            raise RequestError(503, "model is not loaded yet")
+
+        payload = await _read_json(receive)
+        if path == "/score":
+            return 200, (await service.score([payload]))[0]
+        if path == "/score/compare":
+            return 200, (await service.compare([payload]))[0]
+        patients = payload.get("patients") if isinstance(payload, dict) else payload
+        if not isinstance(patients, list):
+            raise RequestError(422, 'expected {"patients": [...]} or a JSON array')
+        return 200, {"results": await service.score(patients)}
+
+
+app = ScoringApp()
@@ -0,0 +1,173 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP STREAM SCORING
+# Newline-delimited JSON in, one JSON result per line out
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Usage:
+#   hl7_to_json | python pulse_iabp_stream.py > scored.jsonl 2> rejected.jsonl
+#   python pulse_iabp_stream.py patients.jsonl --output scored.jsonl --errors rejected.jsonl
+#
+# Each input line is a JSON object with the 16 model features; other keys (e.g.
+# an encounter id) are copied to the result. A reader thread parses and validates
+# records into a bounded queue, so a slow consumer stalls the reader rather than
+# growing memory. The scorer takes whatever is queued (up to --max-batch) as one
+# predict_proba call: single records go straight through when the feed is quiet,
+# and batches grow automatically under load. Results are flushed after every batch.
+# Input is read as bytes and decoded line by line, so a line that is not UTF-8,
+# not JSON or not a valid record is written to the error stream with its line
+# number and never blocks valid records. Any other failure of the reader stops
+# the run with a non-zero exit status rather than ending the stream early. Implausible values are scored and listed under "warnings".
+# With PULSE_IABP_AUDIT_DIR set, every scored batch also goes to the audit log.
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+from pulse_iabp_artifact import ARTIFACT_PATH, load_predictor, model_version
+from pulse_iabp_audit import audit_log_from_env
+from pulse_iabp_drift import DriftMonitor
+from pulse_iabp_model import BUNDLE_PATH, record_to_row, risk_category_labels
+from pulse_iabp_validation import InputValidator
+
+DEFAULT_MAX_BATCH = 1024
+DEFAULT_QUEUE_SIZE = 8192
+
+_END = object()
+
+
+def _read_records(lines, features, records, errors, failure):
+    """Reader thread: parse and validate each line, queueing (record, row) pairs.
+
+    Per-line problems go to ``errors``; anything else is appended to ``failure``
+    for the scoring thread to raise.
+    """
+    try:
+        for line_number, line in enumerate(lines, start=1):
+            try:
+                if isinstance(line, bytes):
+                    line = line.decode("utf-8")
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                row = record_to_row(record, features)
+            # UnicodeDecodeError and JSONDecodeError are ValueErrors; huge integers overflow
+            # float conversion and deeply nested arrays exhaust the parser's recursion
+            except (ValueError, OverflowError, RecursionError) as e:
+                errors.write(json.dumps({"line": line_number, "error": str(e)}) + "\n")
+                errors.flush()
+                continue
+            records.put((record, row))
+    except Exception as e:
+        failure.append(e)
+    finally:
+        records.put(_END)
+
+
+def score_stream(lines, output, errors, model, bundle, validator, max_batch=DEFAULT_MAX_BATCH,
+                 queue_size=DEFAULT_QUEUE_SIZE, audit=None, drift=None, version=None):
+    """Score JSON lines (bytes or str) from ``lines`` into ``output``; returns (scored, batches)."""
+    features = bundle["model_info"]["features"]
+    thresholds = bundle["risk_thresholds"]
+    feature_set = set(features)
+    version = version or model_version(bundle)
+
+    records = queue.Queue(maxsize=queue_size)
+    failure = []
+    reader = threading.Thread(target=_read_records, args=(lines, features, records, errors, failure),
+                              daemon=True)
+    reader.start()
+
+    n_scored = n_batches = 0
+    finished = False
+    while not finished:
+        batch = [records.get()]
+        while len(batch) < max_batch:
+            try:
+                batch.append(records.get_nowait())
+            except queue.Empty:
+                break
+        if batch[-1] is _END:
+            batch.pop()
+            finished = True
+        if not batch:
+            continue
+
+        X = np.vstack([row for _, row in batch])
+        probs = model.predict_proba(X)[:, 1]
+        codes = validator.check(X)
+        categories = risk_category_labels(probs, thresholds)
+        for (record, row), prob, category, code in zip(batch, probs, categories, codes):
+            result = {k: v for k, v in record.items() if k not in feature_set}
+            result["probability"] = float(prob)
+            result["risk_score"] = float(prob * 100)
+            result["risk_category"] = category
+            result["model_version"] = version
+            result["warnings"] = validator.messages(row) if code else []
+            output.write(json.dumps(result) + "\n")
+        output.flush()
+        if audit is not None:
+            audit.record(X, probs, categories, version, "stream")
+        if drift is not None:
+            drift.update(X, probs)
+        n_scored += len(batch)
+        n_batches += 1
+
+    reader.join()
+    if failure:
+        raise failure[0]
+    return n_scored, n_batches
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMMAND LINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score newline-delimited JSON patient records.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file, or - for stdin (default)")
+    parser.add_argument("--output", default="-", help="results JSONL, or - for stdout (default)")
+    parser.add_argument("--errors", default="-", help="rejected records JSONL, or - for stderr (default)")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help="largest predict_proba call (default: %(default)s)")
+    parser.add_argument("--bundle", default=BUNDLE_PATH, help="model bundle (default: %(default)s)")
+    parser.add_argument("--artifact", default=ARTIFACT_PATH, help="native artifact (default: %(default)s)")
+    parser.add_argument("--drift-report", help="write an input drift report (JSON) here at the end")
+    parser.add_argument("--verbose", action="store_true", help="report throughput on stderr at the end")
+    args = parser.parse_args(argv)
+
+    bundle, model = load_predictor(args.bundle, args.artifact)
+    validator = InputValidator.from_bundle(bundle, args.artifact)
+    audit = audit_log_from_env(bundle["model_info"]["features"])
+    drift = DriftMonitor.from_bundle(bundle, args.artifact) if args.drift_report else None
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    errors = sys.stderr if args.errors == "-" else open(args.errors, "w", encoding="utf-8")
+    start = time.perf_counter()
+    try:
+        n_scored, n_batches = score_stream(source, output, errors, model, bundle, validator, args.max_batch,
+                                           audit=audit, drift=drift, version=model_version(bundle, args.bundle))
+    finally:
+        if audit is not None:
+            audit.close()
+        for stream in (source, output, errors):
+            if stream not in (sys.stdin.buffer, sys.stdout, sys.stderr):
+                stream.close()
+
+    if drift is not None:
+        with open(args.drift_report, "w", encoding="utf-8") as f:
+            json.dump(drift.report(), f, indent=2)
+
+    if args.verbose:
+        seconds = time.perf_counter() - start
+        print(f"Scored {n_scored:,} records in {n_batches:,} batches, {seconds:.2f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP INPUT VALIDATION
+# Vectorised range, consistency and plausibility checks with per-row reason codes
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# The calculator's sliders bound every input, but cohort files, the HTTP service
+# and the JSONL stream do not. InputValidator.check() screens a whole (n, d)
+# matrix with NumPy masks and returns one reason code per row, a bit field of
+#
+#     OUT_OF_RANGE         value outside the registry's [low, high], or a binary
+#                          feature other than 0/1
+#     INCONSISTENT         a cross-field rule fails, e.g. hemoglobin_min > hemoglobin_max
+#     OUT_OF_DISTRIBUTION  a continuous value more than z_limit standard deviations
+#                          from the training mean (the bundle's StandardScaler)
+#
+# A code of 0 means the row passed every check. Flagged rows are still scored;
+# the code tells the caller how far to trust the estimate. Missing values (NaN)
+# are not flagged here, they are handled by the scorers.
+
+import numpy as np
+
+from pulse_iabp_artifact import ARTIFACT_PATH, load_arrays
+from pulse_iabp_model import FEATURE_REGISTRY
+
+OUT_OF_RANGE = 1
+INCONSISTENT = 2
+OUT_OF_DISTRIBUTION = 4
+
+REASONS = {
+    OUT_OF_RANGE: "out_of_range",
+    INCONSISTENT: "inconsistent",
+    OUT_OF_DISTRIBUTION: "out_of_distribution",
+}
+
+# (lower, upper) pairs where the first feature may not exceed the second
+CONSISTENCY_RULES = (
+    ("hemoglobin_min", "hemoglobin_max"),
+)
+
+DEFAULT_Z_LIMIT = 4.0
+
+# Rows checked per block; keeps the boolean temporaries in cache for large cohorts
+BLOCK_ROWS = 65536
+
+
+def training_statistics(bundle, artifact_path=ARTIFACT_PATH):
+    """(mean, scale) of the bundle's StandardScaler, from the artifact when ``bundle`` is its header."""
+    if "models" in bundle:
+        scaler = bundle["models"]["scaler"]
+        return scaler.mean_, scaler.scale_
+    arrays = load_arrays(artifact_path, bundle)
+    return arrays["scaler_mean"], arrays["scaler_scale"]
+
+
+def reason_names(code):
+    """["out_of_range", ...] for one row's reason code."""
+    return [name for bit, name in REASONS.items() if code & bit]
+
+
+class InputValidator:
+    """Per-row reason codes for (n, n_features) matrices in the model's feature order."""
+
+    def __init__(self, features, mean, scale, z_limit=DEFAULT_Z_LIMIT, rules=CONSISTENCY_RULES):
+        self.features = list(features)
+        self.z_limit = z_limit
+        specs = [FEATURE_REGISTRY[f] for f in self.features]
+        self._low = np.array([spec.low for spec in specs], dtype=float)
+        self._high = np.array([spec.high for spec in specs], dtype=float)
+        self._binary = np.array([spec.is_binary for spec in specs])
+        self._continuous = ~self._binary
+        self._mean = np.asarray(mean, dtype=float)[self._continuous]
+        self._scale = np.asarray(scale, dtype=float)[self._continuous]
+        self.rules = [(lower, upper) for lower, upper in rules if lower in self.features and upper in self.features]
+        self._lower = np.array([self.features.index(lower) for lower, _ in self.rules], dtype=int)
+        self._upper = np.array([self.features.index(upper) for _, upper in self.rules], dtype=int)
+
+    @classmethod
+    def from_bundle(cls, bundle, artifact_path=ARTIFACT_PATH, **kwargs):
+        mean, scale = training_statistics(bundle, artifact_path)
+        return cls(bundle["model_info"]["features"], mean, scale, **kwargs)
+
+    def _check_block(self, X):
+        out_of_range = ((X < self._low) | (X > self._high)).any(axis=1)
+        binary = X[:, self._binary]
+        out_of_range |= ((binary != 0) & (binary != 1) & ~np.isnan(binary)).any(axis=1)
+        inconsistent = (X[:, self._lower] > X[:, self._upper]).any(axis=1)
+        z = np.abs(X[:, self._continuous] - self._mean)
+        atypical = (z > self.z_limit * self._scale).any(axis=1)
+        return (out_of_range * OUT_OF_RANGE
+                | inconsistent * INCONSISTENT
+                | atypical * OUT_OF_DISTRIBUTION).astype(np.uint8)
+
+    def check(self, X):
+        """Reason code per row (0 = passed every check)."""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        codes = np.empty(len(X), dtype=np.uint8)
+        for start in range(0, len(X), BLOCK_ROWS):
+            codes[start:start + BLOCK_ROWS] = self._check_block(X[start:start + BLOCK_ROWS])
+        return codes
+
+    def messages(self, x):
+        """Human-readable findings for one patient, e.g. for a calculator warning."""
+        x = np.asarray(x, dtype=float).ravel()
+        found = []
+        for j, feature in enumerate(self.features):
+            if x[j] < self._low[j] or x[j] > self._high[j] or (self._binary[j] and x[j] not in (0, 1)):
+                found.append(f"{feature} = {x[j]:g} is outside the accepted range "
+                             f"{self._low[j]:g}–{self._high[j]:g}")
+        for (lower, upper), i, j in zip(self.rules, self._lower, self._upper):
+            if x[i] > x[j]:
+                found.append(f"{lower} ({x[i]:g}) exceeds {upper} ({x[j]:g})")
+        z = (x[self._continuous] - self._mean) / self._scale
+        for feature, value in zip(np.array(self.features)[self._continuous][np.abs(z) > self.z_limit],
+                                  z[np.abs(z) > self.z_limit]):
+            found.append(f"{feature} is {abs(value):.1f} SD {'above' if value > 0 else 'below'} "
+                         f"the training cohort mean")
+        return found
@@ -0,0 +1,84 @@
+# ═══════════════════════════════════════════════════════════════════════════════
+# PULSE-IABP COMPILED PREDICTOR TESTS
+# Compiled evaluators and the exported artifact against sklearn predict_proba
+# ═══════════════════════════════════════════════════════════════════════════════
+#
+# Run from the repository root:
+#   python -m pytest -q
+
+import numpy as np
+import pytest
+from sklearn.svm import SVC
+
+from pulse_iabp_artifact import PRIMARY_MODEL, export_artifact, file_sha256, load_artifact, load_models
+from pulse_iabp_compiled import DEFAULT_TOLERANCE, CompiledSVC, CompiledSVM, compile_models
+from pulse_iabp_model import BUNDLE_PATH, FEATURE_REGISTRY, load_bundle
+from pulse_iabp_registry import ModelSet
+
+
+@pytest.fixture(scope="module")
+def bundle():
+    return load_bundle(BUNDLE_PATH)
+
+
+@pytest.fixture(scope="module")
+def X(bundle):
+    """Support vectors of the primary model plus random patients across the input ranges."""
+    features = bundle["model_info"]["features"]
+    rng = np.random.default_rng(0)
+    low = np.array([FEATURE_REGISTRY[f].low for f in features])
+    high = np.array([FEATURE_REGISTRY[f].high for f in features])
+    random = rng.uniform(low, high, size=(500, len(features)))
+    binary = [FEATURE_REGISTRY[f].is_binary for f in features]
+    random[:, binary] = np.round(random[:, binary])
+    support = CompiledSVM.from_calibrated(bundle["models"][PRIMARY_MODEL]).reference_sample()
+    return np.vstack([support, random])
+
+
+def sklearn_proba(bundle, name, X):
+    """sklearn P(death) of bundle model ``name``; a bare SVC sees scaled inputs."""
+    models = bundle["models"]
+    if isinstance(models[name], SVC):
+        X = (X - models["scaler"].mean_) / models["scaler"].scale_
+    return models[name].predict_proba(X)[:, 1]
+
+
+def max_error(p, q):
+    return float(np.max(np.abs(np.asarray(p) - np.asarray(q))))
+
+
+def test_compiled_svm_matches_sklearn(bundle, X):
+    model = bundle["models"][PRIMARY_MODEL]
+    compiled = CompiledSVM.from_calibrated(model)
+    assert max_error(compiled.predict_proba(X), model.predict_proba(X)) <= DEFAULT_TOLERANCE
+
+
+def test_compiled_svc_matches_sklearn(bundle, X):
+    models = bundle["models"]
+    svc_names = [name for name, model in compile_models(bundle).items() if isinstance(model, CompiledSVC)]
+    assert svc_names
+    for name in svc_names:
+        compiled = CompiledSVC.from_svc(models[name], models["scaler"])
+        assert max_error(compiled.predict_proba(X)[:, 1], sklearn_proba(bundle, name, X)) <= DEFAULT_TOLERANCE
+
+
+def test_stacked_models_match_sklearn(bundle, X):
+    model_set = ModelSet(bundle, compile_models(bundle))
+    for name, probs in model_set.predict_all(X).items():
+        assert max_error(probs, sklearn_proba(bundle, name, X)) <= DEFAULT_TOLERANCE
+
+
+def test_artifact_round_trip(bundle, X, tmp_path):
+    path = str(tmp_path / "artifact")
+    export_artifact(bundle, path, file_sha256(BUNDLE_PATH))
+
+    header, compiled = load_artifact(path)
+    assert header["model_info"]["features"] == bundle["model_info"]["features"]
+    model = bundle["models"][PRIMARY_MODEL]
+    assert max_error(compiled.predict_proba(X), model.predict_proba(X)) <= DEFAULT_TOLERANCE
+
+    header, models = load_models(BUNDLE_PATH, path)
+    assert "models" not in header  # loaded from the artifact, not recompiled
+    assert set(models) == set(compile_models(bundle))
+    for name, loaded in models.items():
+        assert max_error(loaded.predict_proba(X)[:, 1], sklearn_proba(bundle, name, X)) <= DEFAULT_TOLERANCE